@@ -0,0 +1,188 @@
+"""Drive batchy coroutines from an asyncio event loop.
+
+Sample usage:
+
+    @coroutine()
+    def fetch_post(id):
+        post, comments = yield fetch_post_data(id), http_client.get(comments_url(id))
+        coro_return(render(post, comments))
+
+    html = await batchy.asyncio.run(fetch_post, 3)
+
+Inside such a loop, coroutines may yield asyncio futures and awaitables
+alongside regular batchy dependencies; `async def` coroutines may await
+them. Coroutine objects not made by batchy (@runloop_coroutine and friends)
+run as asyncio tasks. The run loop never blocks: each round runs on its own
+event loop tick, and while every coroutine is waiting on asyncio the event
+loop is free to run other requests.
+
+Avoid the blocking helpers (batchy.futures, batchy.gevent) in these loops;
+yield asyncio.wrap_future(...) instead.
+"""
+from __future__ import absolute_import
+
+import asyncio
+import inspect
+
+from .compat import is_nextable
+from .runloop import (RunLoop, Timeout, _DeferredIterable, _set_current_run_loop, _owned,
+                      _drop_abandoned, clock)
+
+class AsyncioRunLoop(RunLoop):
+    runs_coroutines = False
+
+    def __init__(self, event_loop=None, deadline=None):
+        """With `deadline` (in seconds from now), the result future fails with
+        batchy.runloop.Timeout if the loop isn't done in time."""
+        super(AsyncioRunLoop, self).__init__()
+        self.event_loop = event_loop or asyncio.get_event_loop()
+        self.pending_futures = {}  # {asyncio future: [deferred, deferred, ...]}
+        self.finished_futures = []
+        self.pending_timers = 0
+        self.result_future = None
+        self.tick_scheduled = False
+        if deadline is not None:
+            self.deadline = clock() + deadline
+
+    def wrap_dependency(self, dependency):
+        # Batchy's own deferreds are awaitable too, but those (like its own
+        # coroutines, which never get here) are run by the loop itself.
+        if not (asyncio.isfuture(dependency) or
+                (inspect.isawaitable(dependency) and not is_nextable(dependency))):
+            return dependency
+
+        future = asyncio.ensure_future(dependency, loop=self.event_loop)
+        d = _DeferredIterable()
+        if future.done():
+            self._resolve(future, [d])
+        elif future in self.pending_futures:
+            self.pending_futures[future].append(d)
+        else:
+            self.pending_futures[future] = [d]
+            future.add_done_callback(self._on_future_done)
+        return d
+
+    def start(self, fn, *args, **kwargs):
+        """Starts running fn(*args, **kwargs) in this loop. Returns an asyncio
+        future for its result.
+
+        `fn` may also be an already created coroutine, in which case no
+        arguments may be passed."""
+        assert self.result_future is None, 'Run loop already started'
+
+        self.result_future = self.event_loop.create_future()
+        self.result_future.add_done_callback(self._on_result_done)
+
+        previous = _set_current_run_loop(self)
+        try:
+            it = _owned(fn(*args, **kwargs) if callable(fn) else fn)
+            self.main_runnable = self.add(it)
+            self.context = self.main_runnable.context
+        except Exception as e:
+            self.result_future.set_exception(e)
+            return self.result_future
+        finally:
+            _set_current_run_loop(previous)
+
+        if self.deadline is not None:
+            self.event_loop.call_later(max(0, self.deadline - clock()),
+                                       self._on_deadline)
+        self._schedule_tick()
+        return self.result_future
+
+    def call_later(self, delay, fn):
+        # Timers run on the event loop; the run loop never blocks.
+        self.pending_timers += 1
+        def fire():
+            self.pending_timers -= 1
+            fn()
+            self._schedule_tick()
+        self.event_loop.call_later(delay, fire)
+
+    def _on_deadline(self):
+        if not self.result_future.done():
+            self._finished()
+            self.result_future.set_exception(Timeout(
+                'Run loop deadline passed with %d runnables pending' % self.total_pending))
+            for future in self.pending_futures:
+                future.cancel()
+
+    def _schedule_tick(self):
+        if not self.tick_scheduled:
+            self.tick_scheduled = True
+            self.event_loop.call_soon(self._tick)
+
+    def _on_future_done(self, future):
+        self.finished_futures.append(future)
+        self._schedule_tick()
+
+    def _on_result_done(self, result_future):
+        if result_future.cancelled():
+            for future in self.pending_futures:
+                future.cancel()
+
+    def _resolve(self, future, deferreds):
+        if future.cancelled():
+            exc = asyncio.CancelledError()
+        else:
+            exc = future.exception()
+
+        for d in deferreds:
+            if exc is None:
+                d.set_value(future.result())
+            else:
+                d.set_exception(type(exc), exc, exc.__traceback__)
+
+    def _drop_abandoned(self):
+        """Cancels asyncio futures that nothing waits on anymore (e.g. after a
+        timeout), failing their deferreds with Cancelled. Returns True if there
+        were any."""
+        if not self.abandoned:
+            return False
+        self.abandoned = False
+        futures = list(self.pending_futures)
+        _, abandoned = _drop_abandoned(futures, [self.pending_futures[f] for f in futures])
+        for future in abandoned:
+            del self.pending_futures[future]
+            future.cancel()
+        return bool(abandoned)
+
+    def _tick(self):
+        """Runs a single round of the loop."""
+        self.tick_scheduled = False
+        if self.result_future.done():
+            return  # Cancelled.
+
+        previous = _set_current_run_loop(self)
+        try:
+            finished, self.finished_futures = self.finished_futures, []
+            for future in finished:
+                deferreds = self.pending_futures.pop(future, None)
+                if deferreds is not None:  # Not dropped by _drop_abandoned.
+                    self._resolve(future, deferreds)
+
+            if self.run_queue:
+                self._run_round()
+        finally:
+            _set_current_run_loop(previous)
+
+        if not self.total_pending:
+            self._finished()
+
+            if self.main_runnable.result_exception:
+                self.result_future.set_exception(self.main_runnable.result_exception[1])
+            else:
+                self.result_future.set_result(self.main_runnable.result)
+        elif self.run_queue or self._drop_abandoned():
+            self._schedule_tick()
+        elif not self.pending_futures and not self.pending_timers:
+            self.result_future.set_exception(RuntimeError(
+                'Run loop is blocked, but is not waiting on anything'))
+
+def run(fn, *args, **kwargs):
+    """Runs fn(*args, **kwargs) in a new run loop on the current asyncio event
+    loop. Returns an asyncio future for the result:
+
+    posts = await batchy.asyncio.run(fetch_posts, ids)
+    """
+    return AsyncioRunLoop().start(fn, *args, **kwargs)
@@ -1,37 +1,375 @@
+from collections import deque
 import heapq
 from functools import wraps, partial
+from importlib import import_module
 import sys
 
-from .local import RunLoopLocal
-from .runloop import runloop_coroutine, current_run_loop, deferred, coro_return, requires_runloop
+from .compat import iteritems, is_nextable, is_coroutine
+from .local import RunLoopLocal, CallLocal
+from .runloop import (RunLoop, Timeout, runloop_coroutine, current_run_loop,
+                      deferred, coro_return, remaining_time, requires_runloop,
+                      _set_current_run_loop, _owned, _InContext, _drop_abandoned, clock)
 from .context import runloop_coroutine_with_context
 from .hook import add_hook
+from . import diagnostics, futures, stats, trace
 
 BATCH_MANAGER_HOOK_PRIORITY = 10
 
+_NOT_CACHED = object()
+
+_BATCH_SPAWN_FN = None
+
+def use_concurrent_dispatch(spawn_fn):
+    """Dispatch the batches that go out together (all batches of the same
+    priority) each through `spawn_fn`, and wait for all of them together. With
+    blocking backends the round then takes as long as the slowest batch
+    instead of the sum of all of them.
+
+    `spawn_fn(fn, *args)` must be a runloop coroutine that runs fn(*args)
+    elsewhere, like batchy.gevent.spawn or partial(batchy.futures.submit,
+    thread_pool_executor). Each batch function then runs to completion in its
+    own run loop, so batchy calls made from inside a batch function are only
+    batched with each other. Use gevent dispatch with use_gevent_local()."""
+    global _BATCH_SPAWN_FN
+    _BATCH_SPAWN_FN = spawn_fn
+
+def use_inline_dispatch():
+    """Run batch functions in the run loop itself (the default). Batches of
+    the same priority are started together, so batchy calls made from
+    inside them are batched with each other."""
+    global _BATCH_SPAWN_FN
+    _BATCH_SPAWN_FN = None
+
+class _BatchOptions(object):
+    """Settings given to @batch_coroutine, shared by every call."""
+    def __init__(self, priority=0, accepts_kwargs=True, max_batch_size=None,
+                 max_batch_bytes=None, size_fn=None, max_concurrent_chunks=None,
+                 dedupe=False, key=None, cache_per_loop=False, cache=None,
+                 executor=None, split=None, optional=None, coalesce=None):
+        assert max_batch_bytes is None or size_fn is not None, \
+            'max_batch_bytes needs a size_fn to measure arguments with'
+
+        self.priority = priority
+        self.accepts_kwargs = accepts_kwargs
+        self.max_batch_size = max_batch_size
+        self.max_batch_bytes = max_batch_bytes
+        self.size_fn = size_fn
+        self.max_concurrent_chunks = max_concurrent_chunks
+        self.dedupe = dedupe or key is not None
+        self.key = key
+        self.cache_per_loop = cache_per_loop
+        self.cache = cache
+        self.executor = executor
+        self.split = split
+        self.optional = optional
+        self.coalesce = coalesce
+
+    def call_key(self, args_tuple):
+        """Returns a hashable key identifying a single call's arguments."""
+        if self.accepts_kwargs:
+            args, kwargs = args_tuple
+            if self.key is not None:
+                return self.key(*args, **kwargs)
+            return (args, frozenset(iteritems(kwargs))) if kwargs else (args, None)
+        elif self.key is not None:
+            return self.key(*args_tuple)
+        return args_tuple
+
+    def dedupe_batch(self, args, deferreds):
+        """Collapses calls with equal keys into one. Returns the distinct
+        argument list and a matching list of deferreds, where duplicated calls
+        share a _DeferredGroup. Calls with unhashable keys go out as they are."""
+        index = {}
+        unique_args = []
+        unique_deferreds = []
+        for args_tuple, d in zip(args, deferreds):
+            try:
+                k = self.call_key(args_tuple)
+                i = index.get(k)
+            except TypeError:
+                unique_args.append(args_tuple)
+                unique_deferreds.append(d)
+                continue
+
+            if i is None:
+                index[k] = len(unique_args)
+                unique_args.append(args_tuple)
+                unique_deferreds.append(d)
+            else:
+                group = unique_deferreds[i]
+                if not isinstance(group, _DeferredGroup):
+                    group = unique_deferreds[i] = _DeferredGroup(group)
+                group.deferreds.append(d)
+        return unique_args, unique_deferreds
+
+    def args_tuple(self, args, kwargs):
+        """Packs a call's arguments the way the batch function receives them."""
+        if self.accepts_kwargs:
+            return (args, kwargs)
+        assert not kwargs, 'This batch function does not accept kwargs'
+        return args
+
+    def chunks(self, args):
+        """Splits a batch's argument list into slices that respect the
+        size limits (and `split`)."""
+        max_batch_size = self.max_batch_size
+        if self.split is not None:
+            even_size = -(-len(args) // self.split)
+            max_batch_size = even_size if max_batch_size is None else min(max_batch_size, even_size)
+
+        if self.max_batch_bytes is None:
+            if max_batch_size is None or len(args) <= max_batch_size:
+                return [slice(0, len(args))]
+
+            return [slice(i, i + max_batch_size)
+                    for i in range(0, len(args), max_batch_size)]
+
+        chunks = []
+        start = chunk_bytes = 0
+        for i, args_tuple in enumerate(args):
+            item_bytes = self.size_fn(args_tuple)
+            if i > start and (chunk_bytes + item_bytes > self.max_batch_bytes or
+                              i - start == max_batch_size):
+                chunks.append(slice(start, i))
+                start, chunk_bytes = i, 0
+            chunk_bytes += item_bytes
+        chunks.append(slice(start, len(args)))
+        return chunks
+
+    def fits(self, args):
+        """Returns True if `args` can go out as a single call under the size
+        limits (`split` aside, which only spreads out a loop's own batches)."""
+        if self.max_batch_size is not None and len(args) > self.max_batch_size:
+            return False
+        if self.max_batch_bytes is not None:
+            return sum(self.size_fn(args_tuple) for args_tuple in args) <= self.max_batch_bytes
+        return True
+
+class _DeferredGroup(object):
+    """Stands in for all the deferreds waiting on the same deduplicated call."""
+    __slots__ = ('deferreds',)
+
+    def __init__(self, first):
+        self.deferreds = [first]
+
+    def set_value(self, value):
+        for d in self.deferreds:
+            d.set_value(value)
+
+    def set_exception(self, type_, value, tb):
+        for d in self.deferreds:
+            d.set_exception(type_, value, tb)
+
+def _call_batch_function(function, args, budget=None):
+    """Runs a batch function on one batch, to completion, in a run loop of its
+    own, with a deadline `budget` seconds (the dispatching loop's remaining
+    time) after it starts. Used to run batches in other threads, greenlets or
+    processes; monotonic clock times don't carry over between processes."""
+    loop = RunLoop()
+    if budget is not None:
+        loop.deadline = clock() + budget
+    previous = _set_current_run_loop(loop)
+    try:
+        results = function(args)
+        if is_nextable(results) or is_coroutine(results) or type(results) is _InContext:
+            results = loop.run(results)
+        return results
+    finally:
+        _set_current_run_loop(previous)
+
+def _is_process_pool(executor):
+    # concurrent.futures is already imported if executor is one of its pools.
+    futures_module = sys.modules.get('concurrent.futures')
+    return futures_module is not None and isinstance(executor, futures_module.ProcessPoolExecutor)
+
+def _resolve_batch_function(module, name):
+    obj = import_module(module)
+    for part in name.split('.'):
+        obj = getattr(obj, part)
+    return obj._batch_function
+
+class _BatchFunctionRef(object):
+    """Stands in for a batch function sent to an executor. Under its own name
+    its module has the @batch_coroutine wrapper instead, so pickling the
+    function itself (for process pools) would fail; this pickles as a lookup
+    of the wrapper's function."""
+    def __init__(self, func):
+        self.func = func
+        self.__name__ = func.__name__
+        self.__module__ = func.__module__
+
+    def __call__(self, *args):
+        return self.func(*args)
+
+    def __reduce__(self):
+        return (_resolve_batch_function,
+                (self.__module__, getattr(self.func, '__qualname__', self.__name__)))
+
+class _Instance(object):
+    """Keys process-wide cache entries of a class_batch_coroutine by its
+    instance. Holds on to the instance, so that a new one can't take over its
+    entries by getting the same id()."""
+    __slots__ = ('obj',)
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __hash__(self):
+        return id(self.obj)
+
+    def __eq__(self, other):
+        return type(other) is _Instance and other.obj is self.obj
+
+    def __ne__(self, other):
+        return not self == other
+
+class _LoopCacheEntry(_DeferredGroup):
+    """A cache_per_loop result. Calls made while it is pending wait on it;
+    failed calls are not cached."""
+    __slots__ = ('cache', 'key', 'ready', 'value', 'process_cache', 'process_key')
+
+    def __init__(self, cache, key, process_cache=None, process_key=None):
+        self.deferreds = []
+        self.cache = cache
+        self.key = key
+        self.ready = False
+        self.value = None
+        self.process_cache = process_cache
+        self.process_key = process_key
+
+    def set_value(self, value):
+        self.ready = True
+        self.value = value
+        if self.process_cache is not None:
+            self.process_cache.set(self.process_key, value)
+        deferreds, self.deferreds = self.deferreds, None
+        for d in deferreds:
+            d.set_value(value)
+
+    def set_exception(self, type_, value, tb):
+        if self.cache.get(self.key) is self:
+            del self.cache[self.key]
+        deferreds, self.deferreds = self.deferreds, None
+        for d in deferreds:
+            d.set_exception(type_, value, tb)
+
+class _LoopCacheLocal(CallLocal):
+    def initialize(self):
+        self.caches = {}  # {fn id: {call key: _LoopCacheEntry}}
+
+_LOOP_CACHE = _LoopCacheLocal()
+
 class BatchManager(object):
     def __init__(self):
         self.batch_queue = []  # (priority, id)
-        self.pending_batches = {}  # {id: (function, [(args, kwargs), ...], [deferred, deferred, ...])}
-
-    def add(self, id_, function, priority, args_tuple, deferred_obj):
-        add_hook(BATCH_MANAGER_HOOK_PRIORITY, self._on_queue_exhausted)
+        self.pending_batches = {}  # {id: (function, options, [(args, kwargs), ...], [deferred, deferred, ...])}
 
+    def add(self, id_, function, options, args_tuple, deferred_obj):
         if id_ not in self.pending_batches:
-            heapq.heappush(self.batch_queue, (-priority, id_))
-            self.pending_batches[id_] = (function, [args_tuple], [deferred_obj])
+            add_hook(BATCH_MANAGER_HOOK_PRIORITY, self._on_queue_exhausted)
+            heapq.heappush(self.batch_queue, (-options.priority, id_))
+            self.pending_batches[id_] = (function, options, [args_tuple], [deferred_obj])
         else:
-            _, arg_list, deferred_list = self.pending_batches[id_]
+            _, _, arg_list, deferred_list = self.pending_batches[id_]
             arg_list.append(args_tuple)
             deferred_list.append(deferred_obj)
 
     @runloop_coroutine()
     def run_next(self):
-        _, id_ = heapq.heappop(self.batch_queue)
-        function, args, deferreds = self.pending_batches.pop(id_)
+        spawn_fn = _BATCH_SPAWN_FN
+
+        # Every batch of the highest priority goes out at once; the rest get
+        # their turn the next time the run queue runs out.
+        priority, id_ = heapq.heappop(self.batch_queue)
+        ids = [id_]
+        while self.batch_queue and self.batch_queue[0][0] == priority:
+            ids.append(heapq.heappop(self.batch_queue)[1])
+        if self.batch_queue:
+            add_hook(BATCH_MANAGER_HOOK_PRIORITY, self._on_queue_exhausted)
+
+        # Calls whose callers were cancelled (e.g. a sibling raised) are
+        # dropped, along with batches that are left empty.
+        batches = []
+        remaining = remaining_time()
+        for id_ in ids:
+            function, options, args, deferreds = self.pending_batches.pop(id_)
+            if (options.optional is not None and remaining is not None and
+                    remaining < options.optional):
+                # Not enough time left before the loop's deadline.
+                exc = Timeout('Skipped optional batch %s with %.3fs left' % (
+                    stats.function_name(function), remaining))
+                for d in deferreds:
+                    d.set_exception(Timeout, exc, None)
+                continue
+
+            calls, _ = _drop_abandoned(list(zip(args, deferreds)), deferreds)
+            args = [args_tuple for args_tuple, _ in calls]
+            deferreds = [d for _, d in calls]
+            if args:
+                batches.append((function, options, args, deferreds))
+
+        if diagnostics.ENABLED:
+            for function, _, _, _ in batches:
+                diagnostics.batch_dispatched(function)
+
+        yield [self._run_batch(function, options, args, deferreds, spawn_fn)
+               for function, options, args, deferreds in batches]
+
+    @runloop_coroutine()
+    def _run_batch(self, function, options, args, deferreds, spawn_fn):
+        if options.executor is not None:
+            spawn_fn = partial(futures.submit, options.executor)
+
+        if options.dedupe and len(args) > 1:
+            try:
+                args, deferreds = options.dedupe_batch(args, deferreds)
+            except Exception:
+                exc_info = sys.exc_info()
+                for d in deferreds:
+                    d.set_exception(*exc_info)
+                return
+
+        chunks = options.chunks(args)
+        if len(chunks) == 1:
+            yield self._run_chunk(function, args, deferreds, spawn_fn, options)
+            return
+
+        limit = options.max_concurrent_chunks
+        if limit is None or limit >= len(chunks):
+            yield [self._run_chunk(function, args[chunk], deferreds[chunk], spawn_fn, options)
+                   for chunk in chunks]
+            return
+
+        # `limit` workers share the chunks, so the next one starts as soon as
+        # any chunk in flight finishes.
+        queue = deque(chunks)
+        yield [self._run_chunks(function, args, deferreds, spawn_fn, options, queue)
+               for _ in range(limit)]
+
+    @runloop_coroutine()
+    def _run_chunks(self, function, args, deferreds, spawn_fn, options, queue):
+        while queue:
+            chunk = queue.popleft()
+            yield self._run_chunk(function, args[chunk], deferreds[chunk], spawn_fn, options)
+
+    @runloop_coroutine()
+    def _run_chunk(self, function, args, deferreds, spawn_fn, options):
+        loop = current_run_loop()
+        loop_stats, tracer = loop.stats, loop.tracer
+        if loop_stats is not None or tracer is not None:
+            start = stats.clock()
+
+        def dispatch(batch):
+            if spawn_fn is None:
+                return _owned(function(batch))
+            return spawn_fn(_call_batch_function, function, batch, remaining_time())
 
         try:
-            results = yield function(args)
+            if options.coalesce is None:
+                results = yield dispatch(args)
+            else:
+                results = yield options.coalesce.call(function, args, dispatch,
+                                                      fits=options.fits)
         except Exception:
             exc_info = sys.exc_info()
             for d in deferreds:
@@ -45,9 +383,14 @@ class BatchManager(object):
 
             for d, r in zip(deferreds, results):
                 d.set_value(r)
-
-        if self.batch_queue:
-            add_hook(BATCH_MANAGER_HOOK_PRIORITY, self._on_queue_exhausted)
+        finally:
+            if loop_stats is not None or tracer is not None:
+                end = stats.clock()
+                name = stats.function_name(function)
+                if loop_stats is not None:
+                    loop_stats.record_batch(name, len(args), end - start)
+                if tracer is not None:
+                    tracer.batch(name, len(args), start, end)
 
     def _on_queue_exhausted(self):
         current_run_loop().add(self.run_next())
@@ -60,48 +403,200 @@ class BatchManagerLocal(RunLoopLocal):
 BATCH_MANAGER = BatchManagerLocal()
 
 @requires_runloop()
-def _batch_defer(fn_id, fn, priority, args):
-    d = yield deferred()
+@trace.named_after('fn')
+def _batch_defer(fn_id, fn, options, args, instance=None):
+    if options.cache is None and not options.cache_per_loop:
+        d = yield deferred()
+        BATCH_MANAGER.batch_manager.add(fn_id, fn, options, args, d)
+        result = yield d
+        coro_return(result)
+
+    key = process_key = options.call_key(args)
+    if options.cache is not None:
+        if instance is not None:
+            process_key = (_Instance(instance), key)
+        result = options.cache.get(process_key, _NOT_CACHED)
+        if result is not _NOT_CACHED:
+            coro_return(result)
+
+    if not options.cache_per_loop:
+        d = yield deferred()
+        BATCH_MANAGER.batch_manager.add(fn_id, fn, options, args, d)
+        result = yield d
+        options.cache.set(process_key, result)
+        coro_return(result)
+
+    cache = _LOOP_CACHE.caches.get(fn_id)
+    if cache is None:
+        cache = _LOOP_CACHE.caches[fn_id] = {}
+
+    entry = cache.get(key)
+    if entry is None or not entry.ready:
+        d = yield deferred()
+        entry = cache.get(key)
+        if entry is None:
+            entry = cache[key] = _LoopCacheEntry(cache, key, options.cache, process_key)
+            BATCH_MANAGER.batch_manager.add(fn_id, fn, options, args, entry)
+
+        if not entry.ready:
+            entry.deferreds.append(d)
+            result = yield d
+            coro_return(result)
+
+    coro_return(entry.value)
 
-    BATCH_MANAGER.batch_manager.add(fn_id, fn, priority, args, d)
+def _batch_spec(batch_fn):
+    """Returns the (fn id, options) a batch coroutine (or a bound batch
+    method) keys its calls by."""
+    spec = getattr(batch_fn, '_batch_spec', None)
+    assert spec is not None, '%r is not a batch coroutine' % (batch_fn,)
 
-    result = yield d
-    coro_return(result)
+    fn_id, options, is_method = spec
+    if is_method:
+        assert getattr(batch_fn, '__self__', None) is not None, \
+            'Pass class batch coroutines bound to their instance'
+        fn_id = (fn_id, id(batch_fn.__self__))
+    return fn_id, options
+
+def prime_loop_cache(batch_fn, result, *args, **kwargs):
+    """Makes calls to `batch_fn` (a cache_per_loop batch coroutine) with
+    these arguments return `result` for the rest of the current run loop,
+    e.g. after fetching the same object through another batch function."""
+    fn_id, options = _batch_spec(batch_fn)
+    assert options.cache_per_loop, '%r does not use cache_per_loop' % (batch_fn,)
+
+    cache = _LOOP_CACHE.caches.setdefault(fn_id, {})
+    key = options.call_key(options.args_tuple(args, kwargs))
+    entry = cache[key] = _LoopCacheEntry(cache, key)
+    entry.ready = True
+    entry.value = result
+
+def clear_loop_cache(batch_fn, *args, **kwargs):
+    """Forgets the current run loop's cached result of `batch_fn` for these
+    arguments (or all of its results, if none are given), e.g. after a
+    write. Calls already waiting on a pending result still get it."""
+    fn_id, options = _batch_spec(batch_fn)
+    assert options.cache_per_loop, '%r does not use cache_per_loop' % (batch_fn,)
+
+    cache = _LOOP_CACHE.caches.get(fn_id)
+    if not cache:
+        return
+
+    if args or kwargs:
+        cache.pop(options.call_key(options.args_tuple(args, kwargs)), None)
+    else:
+        cache.clear()
+
+def batch_coroutine(priority=0, accepts_kwargs=True, max_batch_size=None,
+                    max_batch_bytes=None, size_fn=None, max_concurrent_chunks=None,
+                    dedupe=False, key=None, cache_per_loop=False, cache=None,
+                    executor=None, split=None, optional=None, coalesce=None,
+                    **kwargs):
+    """Turns `fn`, which takes a list of (args, kwargs) tuples (or of args
+    tuples, with accepts_kwargs=False) and returns a list of results, into a
+    coroutine taking a single call's arguments. Calls made in the same round
+    are handed to `fn` together.
+
+     - max_batch_size: split batches with more calls than this into chunks.
+     - max_batch_bytes: split batches whose calls add up to more than this,
+       as measured by size_fn(args_tuple).
+     - max_concurrent_chunks: how many chunks of one batch may be in flight
+       at once (default: all of them).
+     - dedupe: hand each distinct call to `fn` only once; every caller gets
+       the shared result. Only use this when `fn` has no side effects.
+     - key: with dedupe, key(*args, **kwargs) decides which calls are equal
+       (default: the arguments themselves, which must then be hashable).
+       Passing a key implies dedupe.
+     - cache_per_loop: remember results (keyed like dedupe) until the run
+       loop (or batchy.server call) finishes. Repeated calls return at once
+       instead of joining a later batch; see prime_loop_cache and
+       clear_loop_cache.
+     - cache: a batchy.cache.BatchCache to keep results in across run loops.
+     - executor: a concurrent.futures executor to run `fn` in, each chunk
+       through batchy.futures.submit; the loop keeps running other
+       coroutines meanwhile. `fn` may then also be a plain function
+       returning the list of results. With a ProcessPoolExecutor, `fn`
+       must be defined at the top level of its module (or, on python 3.3+,
+       of a class there) and its arguments & results picklable.
+     - split: split every batch into (at most) this many chunks of about
+       the same size, e.g. one per executor worker.
+     - optional: skip batches that would go out with less than this many
+       seconds left before the run loop's deadline; their calls raise
+       batchy.runloop.Timeout. Batch functions can read the time they have
+       left with batchy.runloop.remaining_time().
+     - coalesce: a batchy.coalesce.Coalescer that merges this function's
+       batches with ones dispatched at the same time by other threads'
+       run loops (for methods, on the same instance), within the size
+       limits.
+    """
+    options = _BatchOptions(priority, accepts_kwargs, max_batch_size, max_batch_bytes,
+                            size_fn, max_concurrent_chunks, dedupe, key, cache_per_loop,
+                            cache, executor, split, optional, coalesce)
 
-def batch_coroutine(priority=0, accepts_kwargs=True, **kwargs):
     def wrapper(fn):
         fn_id = id(fn)
+        target = fn if executor is None else _BatchFunctionRef(fn)
 
         @runloop_coroutine_with_context(**kwargs)
         @wraps(fn)
         def wrap_kwargs(*args, **kwargs):
-            return _batch_defer(fn_id, fn, priority, (args, kwargs))
+            if diagnostics.ENABLED:
+                diagnostics.batch_called(fn)
+            return _batch_defer(fn_id, target, options, (args, kwargs))
 
         @runloop_coroutine_with_context(**kwargs)
         @wraps(fn)
         def wrap_no_kwargs(*args):
-            return _batch_defer(fn_id, fn, priority, args)
+            if diagnostics.ENABLED:
+                diagnostics.batch_called(fn)
+            return _batch_defer(fn_id, target, options, args)
 
-        return wrap_kwargs if accepts_kwargs else wrap_no_kwargs
+        wrapped = wrap_kwargs if accepts_kwargs else wrap_no_kwargs
+        wrapped._batch_spec = (fn_id, options, False)
+        wrapped._batch_function = fn
+        return wrapped
     return wrapper
 
-def class_batch_coroutine(priority=0, accepts_kwargs=True, **kwargs):
+def class_batch_coroutine(priority=0, accepts_kwargs=True, max_batch_size=None,
+                          max_batch_bytes=None, size_fn=None, max_concurrent_chunks=None,
+                          dedupe=False, key=None, cache_per_loop=False, cache=None,
+                          executor=None, split=None, optional=None, coalesce=None,
+                          **kwargs):
+    """Same as @batch_coroutine, but for methods; calls are batched per instance."""
+    options = _BatchOptions(priority, accepts_kwargs, max_batch_size, max_batch_bytes,
+                            size_fn, max_concurrent_chunks, dedupe, key, cache_per_loop,
+                            cache, executor, split, optional, coalesce)
+
     def wrapper(fn):
+        # Workers find the batch function by name; without __qualname__
+        # (python < 3.3) a method's name alone doesn't lead to it.
+        if not hasattr(fn, '__qualname__') and _is_process_pool(executor):
+            raise TypeError('Batch method %s.%s can only run on a process pool on python 3.3+'
+                            % (fn.__module__, fn.__name__))
+
         fn_id = id(fn)
+        target = fn if executor is None else _BatchFunctionRef(fn)
 
         @runloop_coroutine_with_context(**kwargs)
         @wraps(fn)
         def wrap_kwargs(self, *args, **kwargs):
+            if diagnostics.ENABLED:
+                diagnostics.batch_called(fn)
             return _batch_defer((fn_id, id(self)),
-                                partial(fn, self),
-                                priority, (args, kwargs))
+                                partial(target, self),
+                                options, (args, kwargs), self)
 
         @runloop_coroutine_with_context(**kwargs)
         @wraps(fn)
         def wrap_no_kwargs(self, *args):
+            if diagnostics.ENABLED:
+                diagnostics.batch_called(fn)
             return _batch_defer((fn_id, id(self)),
-                                partial(fn, self),
-                                priority, args)
+                                partial(target, self),
+                                options, args, self)
 
-        return wrap_kwargs if accepts_kwargs else wrap_no_kwargs
+        wrapped = wrap_kwargs if accepts_kwargs else wrap_no_kwargs
+        wrapped._batch_spec = (fn_id, options, True)
+        wrapped._batch_function = fn
+        return wrapped
     return wrapper
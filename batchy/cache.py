@@ -0,0 +1,176 @@
+"""A process-wide cache for batch coroutine results.
+
+Sample usage:
+
+    USER_CACHE = BatchCache(max_entries=10000, ttl=60)
+
+    @batch_coroutine(cache=USER_CACHE, accepts_kwargs=False)
+    def get_users(args_list):
+        ...
+
+Calls whose result is cached return immediately and never reach the batch
+function; the remaining calls are batched as usual and their results are
+stored. Exceptions are never cached.
+
+Entries are keyed like batch_coroutine(dedupe=True) calls: by the call's
+arguments, or by what the key= function returns. Don't share a cache between
+batch functions. Each instance of a class_batch_coroutine gets entries of its
+own; they keep the instance alive until they're evicted or expire.
+"""
+from __future__ import absolute_import
+
+from collections import OrderedDict
+import threading
+
+from .runloop import clock
+
+class BatchCache(object):
+    """A thread-safe cache bounded by number of entries and/or total size.
+
+     - max_entries, max_bytes: evict entries once either limit is exceeded.
+       max_bytes needs a size_fn(value) to measure results with.
+     - policy: 'lru' (evict the least recently used entry) or 'lfu' (evict
+       the least frequently used entry; ties go to the least recently used).
+     - ttl: seconds after which entries expire (default: never).
+     - negative_ttl: how long to keep results for which is_negative(value)
+       is true - by default, None results (i.e. misses). Defaults to ttl; 0
+       disables negative caching.
+     - clock: returns the time TTLs are measured with (default: the run
+       loop's monotonic clock, so wall clock changes don't move expiry).
+
+    Hit, miss & eviction counts are kept in .stats().
+    """
+    def __init__(self, max_entries=None, max_bytes=None, size_fn=None, policy='lru',
+                 ttl=None, negative_ttl=None, is_negative=None, clock=clock):
+        assert max_bytes is None or size_fn is not None, \
+            'max_bytes needs a size_fn to measure values with'
+        assert policy in ('lru', 'lfu'), 'Unknown eviction policy %r' % (policy,)
+
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size_fn = size_fn
+        self.policy = policy
+        self.ttl = ttl
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+        self.is_negative = is_negative or (lambda value: value is None)
+        self.clock = clock
+
+        self.lock = threading.Lock()
+        self.entries = {}  # {key: [value, expires at or None, size, use count]}
+        self.total_bytes = 0
+        # LRU order is kept in a single bucket; LFU keeps one per use count.
+        self.buckets = {}  # {use count: OrderedDict of keys, least recent first}
+        self.min_count = 1
+
+        self.hits = self.negative_hits = self.misses = 0
+        self.evictions = self.expirations = 0
+
+    def get(self, key, default=None):
+        """Returns the cached value for key, or default."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            if entry[1] is not None and entry[1] <= self.clock():
+                self._remove(key, entry)
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self._touch(key, entry)
+            if self.is_negative(entry[0]):
+                self.negative_hits += 1
+            else:
+                self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        negative = self.is_negative(value)
+        ttl = self.negative_ttl if negative else self.ttl
+        if negative and ttl == 0:
+            return
+
+        size = self.size_fn(value) if self.size_fn is not None else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+
+        with self.lock:
+            old = self.entries.get(key)
+            if old is not None:
+                self._remove(key, old)
+
+            while self.entries and (
+                    (self.max_entries is not None and len(self.entries) >= self.max_entries) or
+                    (self.max_bytes is not None and self.total_bytes + size > self.max_bytes)):
+                self._evict()
+
+            entry = self.entries[key] = [
+                value, None if ttl is None else self.clock() + ttl, size, 0]
+            self.total_bytes += size
+            self._touch(key, entry)
+            self.min_count = 1
+
+    def discard(self, key):
+        """Removes key from the cache, if present."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self._remove(key, entry)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.buckets.clear()
+            self.total_bytes = 0
+            self.min_count = 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'bytes': self.total_bytes,
+                'hits': self.hits,
+                'negative_hits': self.negative_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+    def __len__(self):
+        return len(self.entries)
+
+    # The methods below must be called with the lock held.
+    def _touch(self, key, entry):
+        count = entry[3]
+        if count:
+            self._unlink(key, count)
+            if self.min_count == count and count not in self.buckets:
+                self.min_count = count + 1
+
+        entry[3] = count + 1 if self.policy == 'lfu' else 1
+
+        bucket = self.buckets.get(entry[3])
+        if bucket is None:
+            bucket = self.buckets[entry[3]] = OrderedDict()
+        bucket[key] = None
+
+    def _unlink(self, key, count):
+        bucket = self.buckets[count]
+        del bucket[key]
+        if not bucket:
+            del self.buckets[count]
+
+    def _remove(self, key, entry):
+        del self.entries[key]
+        self._unlink(key, entry[3])
+        self.total_bytes -= entry[2]
+
+    def _evict(self):
+        if self.min_count not in self.buckets:
+            self.min_count = min(self.buckets)
+
+        key = next(iter(self.buckets[self.min_count]))
+        self._remove(key, self.entries[key])
+        self.evictions += 1
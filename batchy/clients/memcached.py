@@ -4,10 +4,32 @@ from itertools import chain
 from ..compat import iteritems, itervalues
 from ..runloop import coro_return, runloop_coroutine
 from ..batch_coroutine import class_batch_coroutine
+from ..futures import submit
 
 class BatchMemcachedClient(object):
-    def __init__(self, real_client):
+    def __init__(self, real_client, executor=None, coalescer=None):
+        """Create a new batchy memcached client.
+
+         - real_client: The underlying pylibmc client
+         - executor: a concurrent.futures executor to make the (blocking)
+           calls to memcached on, so the run loop keeps running other
+           coroutines & backends meanwhile. pylibmc clients aren't
+           thread-safe; use a single thread (ThreadPoolExecutor(1)) per
+           client.
+         - coalescer: a batchy.coalesce.Coalescer to merge get_multi calls
+           with the ones clients in other threads make at the same time.
+           Share it between the clients (for the same servers) of all
+           threads.
+        """
         self.client = real_client
+        self.executor = executor
+        self.coalescer = coalescer
+
+    @runloop_coroutine()
+    def _call(self, fn, *args, **kwargs):
+        if self.executor is None:
+            coro_return(fn(*args, **kwargs))
+        coro_return((yield submit(self.executor, fn, *args, **kwargs)))
 
     @runloop_coroutine()
     def get(self, k):
@@ -26,10 +48,21 @@ class BatchMemcachedClient(object):
             # In case args[0] is a generator, save the entire list for later merging.
             saved_key_lists.append([key_prefix + k for k in args[0]])
 
-        results = self.client.get_multi(frozenset(chain.from_iterable(saved_key_lists)))
+        keys = frozenset(chain.from_iterable(saved_key_lists))
+        if self.coalescer is None:
+            results = yield self._call(self.client.get_multi, keys)
+        else:
+            # Clients sharing a coalescer are for the same servers, so any
+            # of them can fetch the others' keys.
+            results, = yield self.coalescer.call(self._get_key_sets, [keys], key='get_multi')
         coro_return([{k: results[k] for k in lst if k in results}
                      for lst in saved_key_lists])
-        yield  # pragma: no cover
+
+    @runloop_coroutine()
+    def _get_key_sets(self, key_sets):
+        """Fetches several threads' keys at once; they all get every result."""
+        results = yield self._call(self.client.get_multi, frozenset().union(*key_sets))
+        coro_return([results] * len(key_sets))
 
     @runloop_coroutine()
     def set(self, key, value, time=0):
@@ -39,8 +72,7 @@ class BatchMemcachedClient(object):
     @class_batch_coroutine(0)
     def set_multi(self, args):
         """set_multi(dict, key_prefix=b'', time=0)"""
-        coro_return(self._do_set_command(self.client.set_multi, args))
-        yield  # pragma: no cover
+        coro_return((yield self._do_set_command(self.client.set_multi, args)))
 
     @runloop_coroutine()
     def delete(self, key, time=None):
@@ -56,11 +88,9 @@ class BatchMemcachedClient(object):
         for ar, kw in args_list:
             fill_by_time(*ar, **kw)
 
-        for time, d in iteritems(by_time):
-            self.client.delete_multi(d, **({'time': time} if time is not None else {}))
-
-        coro_return(None)
-        yield  # pragma: no cover
+        yield [self._call(self.client.delete_multi, d,
+                          **({'time': time} if time is not None else {}))
+               for time, d in iteritems(by_time)]
 
     @runloop_coroutine()
     def add(self, key, value, time=0):
@@ -70,9 +100,9 @@ class BatchMemcachedClient(object):
     @class_batch_coroutine(0)
     def add_multi(self, args_list):
         """add_multi(dict, key_prefix=b'', time=0)"""
-        coro_return(self._do_set_command(self.client.add_multi, args_list))
-        yield  # pragma: no cover
+        coro_return((yield self._do_set_command(self.client.add_multi, args_list)))
 
+    @runloop_coroutine()
     def _do_set_command(self, fn, args):
         """add & set implementation."""
         by_time = defaultdict(dict)
@@ -82,44 +112,36 @@ class BatchMemcachedClient(object):
         for ar, kw in args:
             fill_by_time(*ar, **kw)
 
-        failed_keys = frozenset(chain.from_iterable(
-            fn(d, time=time)
-            for time, d in iteritems(by_time)))
+        failed = yield [self._call(fn, d, time=time) for time, d in iteritems(by_time)]
+        failed_keys = frozenset(chain.from_iterable(failed))
 
-        return [list(failed_keys & frozenset(ar[0].keys())) for ar, _ in args]
+        coro_return([list(failed_keys & frozenset(ar[0].keys())) for ar, _ in args])
 
     @runloop_coroutine()
     def incr(self, *args, **kwargs):
-        coro_return(self.client.incr(*args, **kwargs))
-        yield  # pragma: no cover
+        coro_return((yield self._call(self.client.incr, *args, **kwargs)))
 
     @runloop_coroutine()
     def incr_multi(self, *args, **kwargs):
         """pylibmc's incr_multi is NOT a superset of incr - it does not return the new value."""
-        coro_return(self.client.incr_multi(*args, **kwargs))
-        yield  # pragma: no cover
+        coro_return((yield self._call(self.client.incr_multi, *args, **kwargs)))
 
     @runloop_coroutine()
     def decr(self, *args, **kwargs):
-        coro_return(self.client.decr(*args, **kwargs))
-        yield  # pragma: no cover
+        coro_return((yield self._call(self.client.decr, *args, **kwargs)))
 
     @runloop_coroutine()
     def replace(self, *args, **kwargs):
-        coro_return(self.client.replace(*args, **kwargs))
-        yield  # pragma: no cover
+        coro_return((yield self._call(self.client.replace, *args, **kwargs)))
 
     @runloop_coroutine()
     def append(self, *args, **kwargs):
-        coro_return(self.client.append(*args, **kwargs))
-        yield  # pragma: no cover
+        coro_return((yield self._call(self.client.append, *args, **kwargs)))
 
     @runloop_coroutine()
     def prepend(self, *args, **kwargs):
-        coro_return(self.client.prepend(*args, **kwargs))
-        yield  # pragma: no cover
+        coro_return((yield self._call(self.client.prepend, *args, **kwargs)))
 
     @runloop_coroutine()
     def flush_all(self):
-        self.client.flush_all()
-        yield  # pragma: no cover
+        yield self._call(self.client.flush_all)
@@ -1,7 +1,9 @@
+from functools import partial
 from itertools import starmap
 
 from ..runloop import coro_return, runloop_coroutine
 from ..batch_coroutine import class_batch_coroutine
+from ..futures import submit
 
 @runloop_coroutine()
 def call_fn(fn, *args, **kwargs):
@@ -9,14 +11,21 @@ def call_fn(fn, *args, **kwargs):
     yield
 
 class BatchRedisClient(object):
-    def __init__(self, redis_client, spawn_fn=call_fn):
+    def __init__(self, redis_client, spawn_fn=call_fn, executor=None):
         """Create a new batchy redis client.
 
          - redis_client: The underlying Redis/StrictRedis object
          - spawn_fn: the runloop coro to use when running
            pipeline.execute(); useful if you want concurrent
            calls to multiple backends (e.g. memcached, redis, db, etc)
+         - executor: a concurrent.futures executor (e.g. a
+           ThreadPoolExecutor) to run pipeline.execute() on; the same as
+           spawn_fn=partial(batchy.futures.submit, executor)
         """
+        if executor is not None:
+            assert spawn_fn is call_fn, 'Pass either spawn_fn or executor'
+            spawn_fn = partial(submit, executor)
+
         self.redis = redis_client
         self.spawn_fn = spawn_fn
 
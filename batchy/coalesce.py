@@ -0,0 +1,174 @@
+"""Merges batches dispatched by run loops in different threads.
+
+Each thread's run loop only batches its own calls; threaded servers end up
+sending many small copies of the same batch at once. A Coalescer, passed
+to a batch coroutine as `coalesce=`, makes the first batch dispatched in a
+window wait for up to `window` seconds (or until `max_items` calls) for
+batches of the same function from other threads. The first thread then
+makes one call with all of them, and hands every other thread its slice of
+the results through that thread's reactor. A run loop waits once per round,
+for all of the batches it dispatched that round:
+
+    COALESCER = batchy.coalesce.Coalescer(window=0.002)
+
+    @batch_coroutine(coalesce=COALESCER)
+    def get_users(arg_lists):
+        ...
+
+Only batches of the same function, bound to the same instance (or partial
+arguments), merge, and only as long as the merged batch stays within the
+function's max_batch_size and max_batch_bytes. A run loop's own batches
+never merge with each other.
+"""
+from __future__ import absolute_import
+
+from functools import partial
+import sys
+import threading
+
+from .compat import reraise, iteritems
+from .hook import add_hook
+from .local import RunLoopLocal
+from .reactor import REACTOR
+from .runloop import (Cancelled, Timeout, runloop_coroutine, current_run_loop, deferred,
+                      coro_return, clock)
+
+# Below batches, so every batch of a round joins the window, and above the
+# reactor, which would block first.
+COALESCE_HOOK_PRIORITY = 7
+
+def _value(value):
+    return value
+
+def _raise(exc_info):
+    reraise(*exc_info)
+
+def _function_key(function):
+    """Batches of the same function, bound to the same instance and partial
+    arguments, merge. Ids are safe to use while the group's leader holds on
+    to `function`."""
+    bound = ()
+    if isinstance(function, partial):
+        bound = tuple(id(arg) for arg in function.args)
+        if function.keywords:
+            bound += tuple(sorted((k, id(v)) for k, v in iteritems(function.keywords)))
+        function = function.func
+    if getattr(function, '__func__', None) is not None:
+        bound += (id(function.__self__),)
+        function = function.__func__
+    return (function, bound)
+
+class _Group(object):
+    def __init__(self, loop, args):
+        self.loop = loop  # The leader's
+        self.args = list(args)
+        self.members = []  # (reactor, deferred, start, count) of the other threads
+
+class _Leading(RunLoopLocal):
+    def initialize(self):
+        self.groups = []  # (function key, _Group, deferred) this loop leads, waiting for the window
+        self.end = None  # When their window closes.
+
+class Coalescer(object):
+    def __init__(self, window=0.002, max_items=None):
+        self.window = window
+        self.max_items = max_items
+        self.condition = threading.Condition()
+        self.groups = {}  # {function key: _Group still taking batches}
+        self.leading = _Leading()
+
+    @runloop_coroutine()
+    def call(self, function, args, dispatch=None, key=None, fits=None):
+        """Returns the results of function(args), made as part of a bigger
+        call if other threads send batches meanwhile. dispatch(args), if
+        given, is the runloop coroutine to make the call with instead.
+
+        Batches with the same `key` merge (by default, see _function_key);
+        pass one to merge batches of interchangeable instances, e.g. a
+        client per thread for the same servers. fits(args), if given,
+        decides whether a merged batch is small enough to go out."""
+        if key is None:
+            key = _function_key(function)
+        max_items = self.max_items
+        loop = current_run_loop()
+
+        d = yield deferred()
+        with self.condition:
+            group = self.groups.get(key)
+            if (group is not None and group.loop is not loop and
+                    (max_items is None or len(group.args) + len(args) <= max_items) and
+                    (fits is None or fits(group.args + list(args)))):
+                reactor = REACTOR.reactor
+                reactor.add('coalesced', d)
+                group.members.append((reactor, d, len(group.args), len(args)))
+                group.args.extend(args)
+                self.condition.notify_all()
+                group = None
+            else:
+                group = self.groups[key] = _Group(loop, args)
+
+        if group is None:
+            coro_return((yield d))
+
+        leading = self.leading
+        if not leading.groups:
+            leading.end = clock() + self.window
+            add_hook(COALESCE_HOOK_PRIORITY, self._on_queue_exhausted)
+        leading.groups.append((key, group, d))
+
+        exc_info = (Cancelled, Cancelled(), None)  # Unless the call finishes.
+        try:
+            yield d  # Until the window closes.
+            results = yield (dispatch or function)(group.args)
+            if results is None:
+                results = [None] * len(group.args)
+            assert len(results) == len(group.args), \
+                'Batch function %s did not return enough results' % (function)
+            exc_info = None
+        except Exception:
+            exc_info = sys.exc_info()
+            raise
+        finally:
+            self._close(key, group)
+            for reactor, member, start, count in group.members:
+                if exc_info is None:
+                    reactor.complete('coalesced', member, _value, results[start:start + count])
+                else:
+                    reactor.complete('coalesced', member, _raise, exc_info)
+
+        coro_return(results[:len(args)])
+
+    def _close(self, key, group):
+        """Stops `group` from taking more batches."""
+        with self.condition:
+            if self.groups.get(key) is group:
+                del self.groups[key]
+
+    def _on_queue_exhausted(self):
+        """Waits, once for all the groups this loop started in the round, for
+        the window to close or for every group to fill up. Groups still
+        waiting at the loop's deadline fail with Timeout."""
+        leading = self.leading
+        groups, leading.groups = leading.groups, []
+        max_items = self.max_items
+        deadline = current_run_loop().deadline
+        end = leading.end if deadline is None else min(leading.end, deadline)
+        with self.condition:
+            while max_items is None or any(len(group.args) < max_items
+                                           for _, group, _ in groups):
+                remaining = end - clock()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            for key, group, _ in groups:
+                if self.groups.get(key) is group:
+                    del self.groups[key]
+
+        if deadline is not None and clock() >= deadline:
+            exc = Timeout('Run loop deadline passed while coalescing batches')
+            for _, _, d in groups:
+                d.set_exception(Timeout, exc, None)
+            return
+
+        for _, _, d in groups:
+            d.set_value(None)
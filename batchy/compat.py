@@ -1,6 +1,19 @@
 import sys
+import types
 PY3 = sys.version_info[0] == 3
 
+# Native (async def) coroutines; None before python 3.5.
+CoroutineType = getattr(types, 'CoroutineType', None)
+
+def is_coroutine(o):
+    return CoroutineType is not None and isinstance(o, CoroutineType)
+
+def is_coroutine_function(fn):
+    if CoroutineType is None:
+        return False
+    import inspect
+    return inspect.iscoroutinefunction(fn)
+
 if PY3:
     def reraise(tp, value, tb=None):
         if value.__traceback__ is not tb:
@@ -11,72 +11,54 @@ context.
 
 from functools import wraps
 
-from .compat import is_nextable
-from .local import RunLoopLocal
-from .runloop import runloop_coroutine, requires_runloop
+from .compat import CoroutineType, is_coroutine_function
+from .runloop import (runloop_coroutine, requires_runloop, current_run_loop,
+                      _InContext, CALLER_CONTEXT)
 
 class _Context(object):
     """Empty object that is used as the context."""
-    pass
-
-class _ContextLocal(RunLoopLocal):
-    def initialize(self):
-        self.context = None
-
-_CURRENT_CONTEXT = _ContextLocal()
+    # {CallLocal: {attribute: value}} of the batchy.server.SharedRunLoop call
+    # this context belongs to, if any.
+    call_locals = None
+
+def _new_context():
+    context = _Context()
+    # Contexts begun while handling a call keep using its CallLocals.
+    parent = current_run_loop().context
+    if parent is not None:
+        context.call_locals = parent.call_locals
+    return context
 
 def runloop_coroutine_with_context(new_context=False, **dec_kwargs):
-    def wrap(fn):
-        # Used to wrap the methods below
-        def _with_context(method):
-            @wraps(method)
-            def method_wrapper(self, *args, **kwargs):
-                old_value, _CURRENT_CONTEXT.context = _CURRENT_CONTEXT.context, self._ctx
-                try:
-                    return method(self, *args, **kwargs)
-                finally:
-                    self._ctx, _CURRENT_CONTEXT.context = _CURRENT_CONTEXT.context, old_value
-            return method_wrapper
-
-        @runloop_coroutine(**dec_kwargs)
-        class Wrapper(object):
-            def __init__(self, *args, **kwargs):
-                if new_context:
-                    self._ctx = _CURRENT_CONTEXT.context = _Context()
-                else:
-                    self._ctx = _CURRENT_CONTEXT.context
-                self._it = fn(*args, **kwargs)
-                assert is_nextable(self._it), '%s did not return an iterator' % (fn)
+    """Creates a coroutine that runs in its caller's context, or with
+    new_context=True, in a context of its own.
 
-            @_with_context
-            def __next__(self):
-                return next(self._it)
-
-            next = __next__
-
-            @_with_context
-            def send(self, *args, **kwargs):
-                return self._it.send(*args, **kwargs)
-
-            @_with_context
-            def throw(self, *args, **kwargs):
-                return self._it.throw(*args, **kwargs)
+    The run loop keeps track of contexts: every coroutine it runs gets the
+    context of the coroutine that yielded it (everything else gets the main
+    coroutine's), so calls only need wrapping to start a context or to be
+    awaitable."""
+    def wrap(fn):
+        if new_context:
+            @runloop_coroutine(**dec_kwargs)
+            @wraps(fn)
+            def begin_context(*args, **kwargs):
+                return _InContext(fn(*args, **kwargs), _new_context())
+            return begin_context
 
-            # Useful for .ready, .on_add_to_loop, .set_value, etc.
-            # This isn't possible without a custom coroutine (i.e. a class),
-            # but we want to support that anyway.
-            def __getattr__(self, name):
-                return getattr(self._it, name)
+        if CoroutineType is None or is_coroutine_function(fn):
+            return runloop_coroutine(**dec_kwargs)(fn)
 
-        # wraps(fn)(Wrapper) doesn't work because __doc__ is immutable on
-        # classes. wraps(fn)(partial(Wrapper)) breaks in magnificent ways.
-        #pylint: disable-msg=W0108
-        return wraps(fn)(lambda *args, **kwargs: Wrapper(*args, **kwargs))
+        # Generators can't be awaited from `async def` coroutines by themselves.
+        @runloop_coroutine(**dec_kwargs)
+        @wraps(fn)
+        def awaitable_call(*args, **kwargs):
+            return _InContext(fn(*args, **kwargs), CALLER_CONTEXT)
+        return awaitable_call
     return wrap
 
 @requires_runloop()
 def get_context():
-    ctx = _CURRENT_CONTEXT.context
+    ctx = current_run_loop().context
     assert ctx, 'Not running in a context. Did you use @runloop_coroutine_clears_context ?'
     return ctx
 
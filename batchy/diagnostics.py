@@ -0,0 +1,173 @@
+"""Finds code that defeats batching.
+
+    batchy.diagnostics.enable()
+
+makes batchy warn (with a RoundTripWarning, pointing at your code) about:
+
+ - batch functions dispatched in several consecutive rounds of one run loop,
+   usually a coroutine yielding one batch call per iteration of a loop:
+
+       for id in ids:
+           users.append((yield get_user(id)))  # Should be one yield of a list.
+
+ - batchy coroutines called from outside a run loop, over and over, from
+   the same line. Each call runs a run loop of its own, so nothing gets
+   batched.
+
+Pass report= to get the Findings yourself instead. Diagnostics slow batchy
+down; use them in tests & development.
+"""
+import os
+import sys
+import threading
+import warnings
+
+from .local import RunLoopLocal
+from .runloop import current_run_loop
+from . import stats
+
+ENABLED = False
+THRESHOLD = 3
+_REPORT = None
+
+_BATCHY_DIR = os.path.dirname(os.path.abspath(__file__))
+
+class RoundTripWarning(UserWarning):
+    pass
+
+class Finding(object):
+    """Something that costs extra round trips. `frames` lists the
+    (filename, line number, function) of the responsible user code."""
+    def __init__(self, kind, message, frames):
+        self.kind = kind
+        self.message = message
+        self.frames = frames
+
+    def __str__(self):
+        return '%s\n%s' % (self.message, '\n'.join(
+            '  %s:%d in %s' % frame for frame in self.frames))
+
+    def __repr__(self):
+        return '<Finding %s: %s>' % (self.kind, self.message)
+
+def enable(threshold=3, report=None):
+    """Reports a batch function once it is dispatched in `threshold`
+    consecutive rounds, and a call site once it starts `threshold` run
+    loops in a row. `report(finding)` defaults to issuing a warning."""
+    global ENABLED, THRESHOLD, _REPORT
+    ENABLED = True
+    THRESHOLD = threshold
+    _REPORT = report
+
+def disable():
+    global ENABLED
+    ENABLED = False
+
+def _report(finding):
+    if _REPORT is not None:
+        _REPORT(finding)
+    else:
+        filename, lineno, _ = finding.frames[0] if finding.frames else ('<unknown>', 0, None)
+        warnings.warn_explicit(str(finding), RoundTripWarning, filename, lineno)
+
+_IS_BATCHY_FILE = {}
+
+def _is_batchy_frame(frame):
+    filename = frame.f_code.co_filename
+    is_batchy = _IS_BATCHY_FILE.get(filename)
+    if is_batchy is None:
+        directory = os.path.dirname(os.path.abspath(filename))
+        is_batchy = _IS_BATCHY_FILE[filename] = \
+            directory == _BATCHY_DIR or directory.startswith(_BATCHY_DIR + os.sep)
+    return is_batchy
+
+def _user_frame(frame):
+    """Returns the innermost frame at or above `frame` outside of batchy."""
+    while frame is not None and _is_batchy_frame(frame):
+        frame = frame.f_back
+    return frame
+
+def _describe(frame):
+    return (frame.f_code.co_filename, frame.f_lineno, frame.f_code.co_name)
+
+class _BatchRounds(RunLoopLocal):
+    def initialize(self):
+        self.call_sites = {}  # {batch name: set of frames that called it since its last dispatch}
+        self.streaks = {}  # {batch name: [last dispatch round, streak, call sites, reported]}
+
+_BATCH_ROUNDS = _BatchRounds()
+
+def batch_called(fn):
+    """Called by batch coroutines when a call joins a batch."""
+    frame = _user_frame(sys._getframe(1))
+    if frame is not None:
+        _BATCH_ROUNDS.call_sites.setdefault(stats.function_name(fn), set()) \
+            .add(_describe(frame))
+
+def batch_dispatched(fn):
+    """Called by the batch manager when it hands a batch to `fn`."""
+    name = stats.function_name(fn)
+    state = _BATCH_ROUNDS
+    sites = state.call_sites.pop(name, ())
+
+    current_round = current_run_loop().rounds
+    streak = state.streaks.get(name)
+    # Results are delivered in the round after the dispatch, so a coroutine
+    # asking again right away leaves a gap of two rounds.
+    if streak is None or current_round - streak[0] > 2:
+        streak = state.streaks[name] = [current_round, 0, set(), False]
+
+    streak[0] = current_round
+    streak[1] += 1
+    streak[2].update(sites)
+    if streak[1] >= THRESHOLD and not streak[3]:
+        streak[3] = True
+        _report(Finding(
+            'consecutive_batches',
+            'Batch function %s was dispatched in %d consecutive rounds; yield its calls '
+            'together instead of one at a time.' % (name, streak[1]),
+            sorted(streak[2])))
+
+class _LoopEntries(threading.local):
+    site = None  # See _call_site().
+    count = 0
+
+_LOOP_ENTRIES = _LoopEntries()
+
+_CO_VARARGS = 0x04
+_CO_VARKEYWORDS = 0x08
+
+def _call_site(frame):
+    """Identifies the place `frame` is at without holding on to it (and
+    everything it references) or changing it. Frames get reused once a call
+    returns, so the frame's id and position alone can't tell a loop in one
+    call apart from separate calls of the same function; the ids of the
+    call's arguments can, as long as they're called with different ones."""
+    code = frame.f_code
+    argcount = (code.co_argcount + getattr(code, 'co_kwonlyargcount', 0) +
+                bool(code.co_flags & _CO_VARARGS) + bool(code.co_flags & _CO_VARKEYWORDS))
+    local_vars = frame.f_locals
+    args = tuple(id(local_vars.get(name)) for name in code.co_varnames[:argcount])
+    return (id(frame), code, frame.f_lasti, args)
+
+def loop_entered():
+    """Called when a coroutine starts a run loop of its own."""
+    entries = _LOOP_ENTRIES
+    frame = _user_frame(sys._getframe(1))
+    if frame is None:
+        entries.site = None
+        return
+
+    site = _call_site(frame)
+    if entries.site == site:
+        entries.count += 1
+        if entries.count == THRESHOLD:
+            _report(Finding(
+                'repeated_loops',
+                'Started %d run loops in a row from the same line; each one runs '
+                'separately, so nothing is batched. Yield the calls together from one '
+                'coroutine instead.' % entries.count,
+                [_describe(frame)]))
+    else:
+        entries.site = site
+        entries.count = 1
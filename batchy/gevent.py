@@ -2,69 +2,49 @@ from __future__ import absolute_import
 
 from functools import partial
 import gevent
-
-from .hook import add_hook
-from .local import RunLoopLocal
-from .runloop import runloop_coroutine, deferred, current_run_loop, coro_return
-
-GEVENT_HOOK_PRIORITY = 5
-
-class GreenletManager(object):
-    def __init__(self):
-        self.pending_greenlets = set()
-        self.finished_queue = []
-
-    def _on_greenlet_completed(self, d, greenlet):
-        # If we were using real threads, this needs a lock; otherwise, we
-        # can assume .append & .remove won't be interrupted.
-        self.finished_queue.append((greenlet, d))
-        self.pending_greenlets.remove(greenlet)
-
-    def add(self, greenlet, d):
-        self.pending_greenlets.add(greenlet)
-        greenlet.rawlink(partial(self._on_greenlet_completed, d))
-
-        add_hook(GEVENT_HOOK_PRIORITY, self._on_queue_exhausted)
-
-    def _on_queue_exhausted(self):
-        current_run_loop().add(self.wait_next())
-
-    @runloop_coroutine()
-    def wait_next(self):
-        while not self.finished_queue:
-            assert self.pending_greenlets
-            gevent.wait(objects=self.pending_greenlets, count=1)
-            # At this point one of the greenlets should have finished and set
-            # a value with the callback above. This sort of depends on an
-            # implementation detail of rawlink - the notifications are done in
-            # FIFO order and we should have registered the _on_greenlet_completed
-            # link before getting here. If this ever changes, we can always add
-            # a gevent.sleep(0) to make the gevent loop delay exiting this function
-
-        while self.finished_queue:
-            greenlet, d = self.finished_queue.pop()
-
-            if greenlet.successful():
-                d.set_value(greenlet.value)
+from gevent.event import Event
+
+from .reactor import REACTOR
+from .runloop import runloop_coroutine, deferred, coro_return, clock
+
+def _result(greenlet):
+    if greenlet.successful():
+        return greenlet.value
+    raise greenlet.exception
+
+def _wait(reactor, until):
+    """Waits for the reactor (or until `until`) while letting other greenlets
+    run. Completions from other threads (e.g. futures) wake it through the
+    hub."""
+    event = Event()
+    loop = gevent.get_hub().loop
+    watcher = (getattr(loop, 'async_', None) or getattr(loop, 'async'))()
+    watcher.start(event.set)
+    reactor.wake = watcher.send
+    try:
+        while not reactor.completed:
+            if until is None:
+                event.wait()
             else:
-                d.set_exception(greenlet.exception)
-
-        if self.pending_greenlets:
-            add_hook(GEVENT_HOOK_PRIORITY, self._on_queue_exhausted)
-
-        yield
-
-
-class GreenletManagerLocal(RunLoopLocal):
-    def initialize(self):
-        self.greenlet_manager = GreenletManager()
-GREENLET_MANAGER = GreenletManagerLocal()
+                remaining = until - clock()
+                if remaining <= 0:
+                    break
+                event.wait(remaining)
+            event.clear()
+    finally:
+        reactor.wake = None
+        watcher.stop()
 
 @runloop_coroutine()
 def greenlet_future(greenlet):
     d = yield deferred()
 
-    GREENLET_MANAGER.greenlet_manager.add(greenlet, d)
+    reactor = REACTOR.reactor
+    reactor.wait_fn = _wait
+    reactor.add('greenlet', d)
+    # Links are called in the hub as soon as the greenlet finishes, so
+    # waiting never has to look at the greenlets that are still running.
+    greenlet.rawlink(partial(reactor.complete, 'greenlet', d, _result))
     coro_return(d)
 
 @runloop_coroutine()
@@ -5,27 +5,36 @@ from .runloop import runloop_coroutine, current_run_loop
 
 class HookManager(object):
     def __init__(self):
-        self.hook_queue = []  # (priority, id)
-        self.pending_hooks = {}  # id -> function
+        self.hook_queue = []  # (-priority, sequence number, key)
+        self.pending_hooks = {}  # key -> function
+        self.added = 0
         current_run_loop().on_queue_exhausted.connect(self._on_queue_exhausted)
 
-    def add(self, id_, function, priority):
-        if id_ not in self.pending_hooks:
-            self.pending_hooks[id_] = function
-            heapq.heappush(self.hook_queue, (-priority, id_))
+    def add(self, key, function, priority):
+        if key not in self.pending_hooks:
+            self.pending_hooks[key] = function
+            self.added += 1
+            heapq.heappush(self.hook_queue, (-priority, self.added, key))
 
     @runloop_coroutine()
-    def run_next(self):
-        _, id_ = heapq.heappop(self.hook_queue)
-        function = self.pending_hooks.pop(id_)
-
-        yield function()
+    def run_hook(self, function):
+        result = function()
+        if result is not None:
+            yield result
 
     def _on_queue_exhausted(self, _):
-        if not self.hook_queue:
+        """Runs every hook of the highest pending priority, in the order they
+        were added; lower priorities wait for the queue to run out again."""
+        hook_queue = self.hook_queue
+        if not hook_queue:
             return
 
-        current_run_loop().add(self.run_next())
+        loop = current_run_loop()
+        priority = hook_queue[0][0]
+        while hook_queue and hook_queue[0][0] == priority:
+            _, _, key = heapq.heappop(hook_queue)
+            # Separate runnables, so one failing hook doesn't stop the others.
+            loop.add(self.run_hook(self.pending_hooks.pop(key)))
 
 class _HookManagerLocal(RunLoopLocal):
     def initialize(self):
@@ -34,4 +43,7 @@ class _HookManagerLocal(RunLoopLocal):
 HOOK_MANAGER = _HookManagerLocal()
 
 def add_hook(priority, fn):
-    HOOK_MANAGER.hook_manager.add(id(fn), fn, priority)
+    """Calls fn() the next time the run loop runs out of runnables; hooks
+    with higher priorities go first. Adding the same fn (or an equal bound
+    method) again before it ran does nothing."""
+    HOOK_MANAGER.hook_manager.add(fn, fn, priority)
@@ -0,0 +1,169 @@
+"""Shows what run loops are waiting on.
+
+    batchy.introspect.install_signal_handler()
+
+makes `kill -USR1 <pid>` print every live run loop to stderr: the thread it
+is running in and where that thread is (e.g. blocked in
+Reactor.wait_next), the coroutines waiting in it and where each one is
+suspended, queued batches, pending hooks and pending futures & greenlets.
+dump_state() returns the same report as a string.
+
+Nothing is recorded ahead of time; loops and coroutines are found with the
+garbage collector when a dump is asked for, so this costs nothing until
+then. Dumps are slow on large heaps.
+"""
+from __future__ import print_function
+
+import gc
+import signal
+import sys
+import threading
+
+from .runloop import RunLoop, _PendingRunnable
+from .trace import coroutine_name
+
+def _local(loop, run_loop_local, attr):
+    """Reads a RunLoopLocal's attribute in `loop` without creating it."""
+    values = loop.locals.get(run_loop_local)
+    return values.get(attr) if values else None
+
+def _location(iterable):
+    frame = getattr(iterable, 'gi_frame', None) or getattr(iterable, 'cr_frame', None)
+    if frame is None:
+        return None
+    return '%s:%d in %s' % (frame.f_code.co_filename, frame.f_lineno, frame.f_code.co_name)
+
+def _describe_runnable(runnable):
+    location = _location(runnable.iterable)
+    name = coroutine_name(runnable.iterable)
+    return '%s (%s)' % (name, location) if location else name
+
+def _loop_threads():
+    """Returns {id(loop): (thread name, innermost frame)} for loops that are
+    running right now."""
+    run_codes = set([RunLoop.run.__code__, RunLoop._run_round.__code__])
+    names = dict((t.ident, t.name) for t in threading.enumerate())
+
+    running = {}
+    for thread_id, frame in sys._current_frames().items():
+        innermost = frame
+        while frame is not None:
+            if frame.f_code in run_codes and 'self' in frame.f_locals:
+                running.setdefault(id(frame.f_locals['self']),
+                                   (names.get(thread_id, thread_id), innermost))
+                break
+            frame = frame.f_back
+    return running
+
+def _batch_lines(loop):
+    from .batch_coroutine import BATCH_MANAGER
+    from .stats import function_name
+
+    manager = _local(loop, BATCH_MANAGER, 'batch_manager')
+    if manager is None:
+        return [], {}
+
+    lines = []
+    queued = {}  # {id(deferred): batch name}
+    for function, _, args, deferreds in manager.pending_batches.values():
+        name = function_name(function)
+        lines.append('%s: %d call(s)' % (name, len(args)))
+        for d in deferreds:
+            for waiting in getattr(d, 'deferreds', None) or [d]:  # Deduplicated calls.
+                queued[id(waiting)] = name
+    return lines, queued
+
+def _hook_lines(loop):
+    from .hook import HOOK_MANAGER
+
+    manager = _local(loop, HOOK_MANAGER, 'hook_manager')
+    if manager is None:
+        return []
+    lines = []
+    for priority, _, key in sorted(manager.hook_queue):
+        fn = manager.pending_hooks[key]
+        name = getattr(fn, '__qualname__', None) or getattr(fn, '__name__', None) or repr(fn)
+        lines.append('priority %s: %s' % (-priority, name))
+    return lines
+
+def _pending_io(loop):
+    from .reactor import REACTOR
+
+    counts = []
+    reactor = _local(loop, REACTOR, 'reactor')
+    if reactor is not None:
+        for kind, count in sorted(reactor.pending.items()):
+            if count:
+                counts.append('%d %s(s)' % (count, kind))
+    pending = getattr(loop, 'pending_futures', None)  # AsyncioRunLoop
+    if pending:
+        counts.append('%d asyncio future(s)' % len(pending))
+    return counts
+
+def dump_state():
+    """Describes every run loop with pending work."""
+    objects = gc.get_objects()
+    # isinstance() would look up __class__, which RunLoopLocals don't allow
+    # outside of a loop.
+    loops = [o for o in objects if issubclass(type(o), RunLoop) and o.total_pending]
+    runnables = [o for o in objects if type(o) is _PendingRunnable
+                 and o.iterable is not None and o.iteration >= 0]
+    del objects
+
+    parents = set(id(r.parent) for r in runnables if r.parent is not None)
+    waiting = [r for r in runnables if id(r) not in parents]
+    running = _loop_threads()
+
+    lines = []
+    if not loops:
+        lines.append('No run loops with pending work.')
+
+    shown = set()
+    for loop in loops:
+        thread = running.get(id(loop))
+        lines.append('%s: round %d, %d pending, %d runnable%s' % (
+            type(loop).__name__, loop.rounds, loop.total_pending, len(loop.run_queue),
+            ', in thread %s at %s:%d in %s' % (
+                thread[0], thread[1].f_code.co_filename, thread[1].f_lineno,
+                thread[1].f_code.co_name) if thread else ''))
+
+        batch_lines, queued = _batch_lines(loop)
+        lines.append('  Waiting coroutines:')
+        for leaf in waiting:
+            chain = []
+            runnable = leaf
+            while runnable is not None:
+                chain.append(runnable)
+                runnable = runnable.parent
+            if chain[-1] is not loop.main_runnable:
+                continue
+
+            shown.add(id(leaf))
+            blocked_on = queued.get(id(leaf.iterable))
+            lines.append('    %s%s' % (
+                ' > '.join(_describe_runnable(r) for r in reversed(chain)),
+                ' [queued in batch %s]' % blocked_on if blocked_on else ''))
+
+        for title, section in (('Queued batches', batch_lines),
+                               ('Pending hooks', _hook_lines(loop)),
+                               ('Pending I/O', _pending_io(loop))):
+            if section:
+                lines.append('  %s:' % title)
+                lines.extend('    ' + line for line in section)
+
+    others = [r for r in waiting if id(r) not in shown]
+    if others:
+        lines.append('Other waiting coroutines (hooks, or loops without pending work):')
+        for leaf in others:
+            lines.append('    %s' % _describe_runnable(leaf))
+    return '\n'.join(lines) + '\n'
+
+def dump(file=None):
+    print(dump_state(), file=file or sys.stderr)
+
+def install_signal_handler(signum=getattr(signal, 'SIGUSR1', None), file=None):
+    """Dumps the state of all run loops to `file` (default: stderr) when the
+    process receives `signum`. Returns the previous handler."""
+    def handler(_signum, _frame):
+        dump(file)
+    return signal.signal(signum, handler)
@@ -1,43 +1,83 @@
-from .runloop import new_local_id, current_run_loop
+from . import runloop as _runloop
+from .runloop import current_run_loop
 
-def _patch(self):
+def _values(local):
+    """Returns `local`'s attributes in the current loop, initializing them if
+    this is the first time it's used there."""
     loop = current_run_loop()
     if loop is None:
         raise RuntimeError('No run loop when accessing run-loop local')
 
-    id_ = object.__getattribute__(self, '_id')
-    try:
-        object.__setattr__(self, '__dict__', loop.locals[id_])
-    except KeyError:
-        loop.locals[id_] = d = {'_id': id_}
-        object.__setattr__(self, '__dict__', d)
-
-        cls = type(self)
-        cls.initialize(self)
+    locals_ = type(local)._locals(local, loop)
+    values = locals_.get(local)
+    if values is None:
+        values = locals_[local] = {}
+        type(local).initialize(local)
+    return values
 
 class RunLoopLocal(object):
-    def __init__(self):
-        object.__setattr__(self, '_id', new_local_id())
+    """Like threading.local, but per run loop. initialize() is called the
+    first time the local is used in each loop.
 
+    Each loop keeps the attributes of its locals in loop.locals, keyed by the
+    local itself; reading one is a dict lookup for the local and one for the
+    attribute. (Hashing a local uses its identity, so the lookups don't run
+    any python code.)"""
     def initialize(self):
         pass
 
+    def _locals(self, loop):
+        return loop.locals
+
     def __getattribute__(self, name):
-        _patch(self)
-        return object.__getattribute__(self, name)
+        try:
+            return _runloop._CURRENT_RUN_LOOP.loop.locals[self][name]
+        except (AttributeError, KeyError):
+            values = _values(self)
+            if name in values:
+                return values[name]
+            return object.__getattribute__(self, name)  # Methods & class attributes.
 
     def __setattr__(self, name, value):
         if name == '__dict__':
             raise AttributeError(
                 "%r object attribute '__dict__' is read-only" % self.__class__.__name__)
 
-        _patch(self)
-        return object.__setattr__(self, name, value)
+        _values(self)[name] = value
 
     def __delattr__(self, name):
         if name == '__dict__':
             raise AttributeError(
                 "%r object attribute '__dict__' is read-only" % self.__class__.__name__)
 
-        _patch(self)
-        return object.__delattr__(self, name)
+        try:
+            del _values(self)[name]
+        except KeyError:
+            raise AttributeError(name)
+
+class CallLocal(RunLoopLocal):
+    """A RunLoopLocal that is also per call in a batchy.server.SharedRunLoop,
+    where one loop runs the calls of many requests. Use it for state that
+    shouldn't outlive a request, like memoized results.
+
+    The values of a call live in its context (see batchy.context), which
+    contexts begun while handling the call inherit; coroutines that run
+    outside of any call (e.g. batch functions) share the loop's."""
+    def _locals(self, loop):
+        context = loop.context
+        if context is None or context.call_locals is None:
+            return loop.locals
+        return context.call_locals
+
+    def __getattribute__(self, name):
+        try:
+            loop = _runloop._CURRENT_RUN_LOOP.loop
+            context = loop.context
+            if context is None or context.call_locals is None:
+                return loop.locals[self][name]
+            return context.call_locals[self][name]
+        except (AttributeError, KeyError):
+            values = _values(self)
+            if name in values:
+                return values[name]
+            return object.__getattribute__(self, name)  # Methods & class attributes.
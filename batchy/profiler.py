@@ -0,0 +1,122 @@
+"""Charges time to coroutines instead of to the run loop.
+
+Under cProfile every coroutine's code looks like it was called by the run
+loop. This profiler times each step of each coroutine instead, and charges
+it to the coroutine's logical stack: the coroutines that are waiting on it.
+
+    with batchy.profiler.profiling() as profiler:
+        render_page(request)
+    profiler.write('/tmp/page.folded', 'cpu')
+
+The output is in the collapsed stack format of flamegraph.pl & speedscope:
+
+    render_page;fetch_posts;fetch_post 1200
+
+Values are microseconds of wall or CPU time, or with profiling(memory=True)
+(python 3.4+), bytes allocated (net of frees) with tracemalloc.
+
+Like tracing, this covers run loops created in this thread (or greenlet)
+while profiling. Time spent between steps - waiting on the network, or in
+batchy itself - isn't charged to anything.
+"""
+import threading
+import time
+
+from .trace import coroutine_name
+
+wall_clock = time.time
+# Per-thread CPU time, where available.
+cpu_clock = getattr(time, 'thread_time', None) or getattr(time, 'process_time', None) or time.clock
+
+_ACTIVE = threading.local()
+
+def current_profiler():
+    return getattr(_ACTIVE, 'profiler', None)
+
+def logical_stack(runnable):
+    """Returns the names of `runnable`'s coroutine and everything waiting on
+    it, outermost first."""
+    names = []
+    while runnable is not None:
+        names.append(coroutine_name(runnable.iterable))
+        runnable = runnable.parent
+    names.reverse()
+    return tuple(names)
+
+class Profiler(object):
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.samples = {}  # {logical stack: [wall seconds, cpu seconds, bytes, steps]}
+        self.tracemalloc = None
+        self.started_tracemalloc = False
+        if memory:
+            import tracemalloc
+            self.tracemalloc = tracemalloc
+
+    def attach(self, loop):
+        """Starts profiling `loop`."""
+        if self.tracemalloc is not None and not self.tracemalloc.is_tracing():
+            self.tracemalloc.start()
+            self.started_tracemalloc = True
+
+        loop.profiler = self
+        # Only profiled loops pay for timing each step.
+        loop._step = self.step
+
+    def step(self, runnable):
+        get_memory = self.tracemalloc.get_traced_memory if self.tracemalloc else None
+        memory_before = get_memory()[0] if get_memory else 0
+        wall_before, cpu_before = wall_clock(), cpu_clock()
+
+        requirements = runnable.step()
+
+        wall, cpu = wall_clock() - wall_before, cpu_clock() - cpu_before
+        allocated = get_memory()[0] - memory_before if get_memory else 0
+
+        stack = logical_stack(runnable)
+        sample = self.samples.get(stack)
+        if sample is None:
+            sample = self.samples[stack] = [0.0, 0.0, 0, 0]
+        sample[0] += wall
+        sample[1] += cpu
+        sample[2] += max(allocated, 0)
+        sample[3] += 1
+        return requirements
+
+    def collapsed(self, metric='wall'):
+        """Returns the samples as collapsed stacks; `metric` is one of 'wall',
+        'cpu' (both in microseconds), 'memory' (bytes) or 'steps'."""
+        index, scale = {'wall': (0, 1e6), 'cpu': (1, 1e6), 'memory': (2, 1),
+                        'steps': (3, 1)}[metric]
+        lines = []
+        for stack, sample in sorted(self.samples.items()):
+            value = int(round(sample[index] * scale))
+            if value:
+                lines.append('%s %d' % (';'.join(stack), value))
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path, metric='wall'):
+        with open(path, 'w') as f:
+            f.write(self.collapsed(metric))
+
+    def stop(self):
+        """Stops tracemalloc, if this profiler started it."""
+        if self.started_tracemalloc:
+            self.tracemalloc.stop()
+            self.started_tracemalloc = False
+
+class profiling(object):
+    """Profiles run loops created in this thread until exit; `as` gives the
+    Profiler."""
+    def __init__(self, profiler=None, memory=False):
+        self.profiler = profiler or Profiler(memory=memory)
+        self.previous = None
+
+    def __enter__(self):
+        self.previous = current_profiler()
+        _ACTIVE.profiler = self.profiler
+        return self.profiler
+
+    def __exit__(self, *exc_info):
+        _ACTIVE.profiler = self.previous
+        self.profiler.stop()
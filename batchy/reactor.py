@@ -0,0 +1,141 @@
+"""Waits for work that finishes outside of the run loop.
+
+Futures (batchy.futures) and greenlets (batchy.gevent) report to their run
+loop's Reactor when they finish. Once the loop runs out of runnables and
+batches to dispatch, it waits on the reactor for any of them: the first
+completion wakes it up without looking at what else is pending, everything
+that finished by then is delivered at once, and the loop goes back to
+running coroutines - and dispatching the batches they make - before it
+waits again.
+
+Waits also end when the loop's next timer (RunLoop.call_later) is due, or
+at the loop's deadline.
+"""
+from __future__ import absolute_import
+
+import sys
+from collections import deque
+from threading import Condition
+
+from .hook import add_hook
+from .local import RunLoopLocal
+from .runloop import runloop_coroutine, current_run_loop, _drop_abandoned, clock
+from . import stats
+
+# Below batches, so everything that can be dispatched is dispatched before
+# the loop blocks.
+REACTOR_HOOK_PRIORITY = 5
+
+class Reactor(object):
+    def __init__(self):
+        self.pending = {}  # {kind: number of operations not delivered yet}
+        self.waiting = {}  # {deferred: kind} for those operations
+        self.completed = deque()  # (kind, deferred, resolve, source)
+        self.condition = Condition()
+        # Replaces waiting on the condition; see batchy.gevent. Called as
+        # wait_fn(reactor, until), it must return once self.completed isn't
+        # empty or at `until` (a runloop.clock() time, or None for never), and
+        # may set self.wake to be called (from any thread) after each
+        # completion.
+        self.wait_fn = None
+        self.wake = None
+
+    def add(self, kind, d=None):
+        """Counts an operation of `kind` (e.g. 'future') as pending until
+        complete() is called for it. Once nothing waits on its deferred `d`
+        anymore, the loop stops waiting for it."""
+        self.pending[kind] = self.pending.get(kind, 0) + 1
+        if d is not None:
+            self.waiting[d] = kind
+        add_hook(REACTOR_HOOK_PRIORITY, self._on_queue_exhausted)
+
+    def wait_for_timers(self):
+        """Makes the loop wait for its timers once it runs out of work."""
+        add_hook(REACTOR_HOOK_PRIORITY, self._on_queue_exhausted)
+
+    def complete(self, kind, d, resolve, source):
+        """Reports that `source` finished; the loop will set `d` to
+        resolve(source), or to what it raised. Safe to call from any thread."""
+        with self.condition:
+            self.completed.append((kind, d, resolve, source))
+            self.condition.notify()
+
+        wake = self.wake
+        if wake is not None:
+            wake()
+
+    def _on_queue_exhausted(self):
+        current_run_loop().add(self.wait_next())
+
+    def _wait(self, until):
+        if self.wait_fn is not None:
+            self.wait_fn(self, until)
+            return
+
+        with self.condition:
+            while not self.completed:
+                if until is None:
+                    self.condition.wait()
+                    continue
+
+                remaining = until - clock()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+
+    def _drop_abandoned(self, loop):
+        """Fails the deferreds of operations whose waiters were cancelled
+        (e.g. timed out) with Cancelled, so the loop doesn't wait for them;
+        their results are thrown away when they arrive. Only looks once
+        something was abandoned since the last time."""
+        if not loop.abandoned:
+            return
+        loop.abandoned = False
+        waiting = [(d, kind) for d, kind in self.waiting.items() if kind is not None]
+        _, dropped = _drop_abandoned(waiting, [d for d, _ in waiting])
+        for d, kind in dropped:
+            self.waiting[d] = None
+            self.pending[kind] -= 1
+
+    @runloop_coroutine()
+    def wait_next(self):
+        loop = current_run_loop()
+        timers = loop.timers
+        # Don't block if something else became runnable while the queue ran
+        # out (e.g. through on_queue_exhausted).
+        if not self.completed and not loop.run_queue:
+            self._drop_abandoned(loop)
+
+        if not self.completed and not loop.run_queue:
+            until = loop.deadline
+            if timers and (until is None or timers[0][0] < until):
+                until = timers[0][0]
+
+            start = stats.clock()
+            self._wait(until)
+            stats.record_wait(loop, start)
+
+        completed = self.completed
+        while completed:
+            kind, d, resolve, source = completed.popleft()
+            if self.waiting.pop(d, kind) is None:
+                continue  # Dropped by _drop_abandoned.
+            self.pending[kind] -= 1
+            try:
+                d.set_value(resolve(source))
+            except Exception:
+                d.set_exception(*sys.exc_info())
+
+        if timers and timers[0][0] <= clock():
+            loop.fire_timers()
+
+        if timers or any(self.pending.values()):
+            add_hook(REACTOR_HOOK_PRIORITY, self._on_queue_exhausted)
+        return
+        yield  # pragma: no cover
+
+class _ReactorLocal(RunLoopLocal):
+    def initialize(self):
+        self.reactor = Reactor()
+
+REACTOR = _ReactorLocal()
@@ -2,11 +2,19 @@ from __future__ import absolute_import
 
 import blinker
 from collections import deque
-from functools import wraps, partial
+from functools import partial, wraps
+import heapq
 from threading import local
+from types import GeneratorType
 import sys
+import time
 
-from .compat import reraise, iteritems, is_nextable
+from .compat import reraise, iteritems, is_nextable, is_coroutine, CoroutineType
+from . import profiler, stats, trace
+
+# Deadlines and timers are measured on a monotonic clock where there is one
+# (python 3.3+), so changes to the wall clock don't fire or extend them.
+clock = getattr(time, 'monotonic', time.time)
 
 def noop(*_, **dummy):
     pass
@@ -18,12 +26,35 @@ class StopIterationWithValue(StopIteration):
         super(StopIterationWithValue, self).__init__()
         self.value = value
 
+class Cancelled(Exception):
+    """Raised from batch calls that were dropped before their batch went out
+    because nothing waited on them anymore."""
+
+class Timeout(Exception):
+    """Raised when a run loop's deadline or a future's timeout passes before
+    the work is done."""
+
+def _orphaned(*_):
+    """Callback of top-level runnables whose result nobody can get anymore."""
+
+_NO_KEY = object()  # Key used for coroutines that yield a single dependency.
+
 class _PendingRunnable(object):
-    def __init__(self, it, parent=None, key=None, callback=None, callback_exc=None):
+    __slots__ = ('iterable', 'iteration', 'parent', 'key', 'parent_iteration',
+                 'callback', 'callback_exc', 'dependency_results',
+                 'dependencies_remaining', 'exception_to_raise', 'result',
+                 'result_exception', 'recyclable', 'context')
+
+    def __init__(self, it, parent=None, parent_iteration=0, key=None,
+                 callback=None, callback_exc=None, context=None):
+        self._reset(it, parent, parent_iteration, key, callback, callback_exc, context)
+
+    def _reset(self, it, parent, parent_iteration, key, callback, callback_exc, context):
         self.iterable = it
         self.iteration = 0
         self.parent = parent
         self.key = key
+        self.parent_iteration = parent_iteration
         self.callback = callback
         self.callback_exc = callback_exc
         self.dependency_results = None
@@ -31,22 +62,29 @@ class _PendingRunnable(object):
         self.exception_to_raise = None
         self.result = None
         self.result_exception = None
+        self.recyclable = False
+        self.context = context
 
     def step(self):
+        """Runs the iterable until its next yield. Returns the yielded
+        requirements, or sets .result/.result_exception and returns None
+        once the iterable is done."""
         assert self.iteration >= 0
 
         self.iteration += 1
-        if self.iteration == 1:
-            assert self.dependency_results is None and self.exception_to_raise is None
-            run_fn = partial(next, self.iterable)
-        elif self.exception_to_raise is not None:
-            exc, self.exception_to_raise = self.exception_to_raise, None
-            run_fn = partial(self.iterable.throw, *exc)
-        else:
-            run_fn = partial(self.iterable.send, self.dependency_results)
-
         try:
-            requirements = run_fn()
+            if self.iteration == 1:
+                assert self.dependency_results is None and self.exception_to_raise is None
+                if type(self.iterable) is CoroutineType:
+                    requirements = self.iterable.send(None)
+                else:
+                    requirements = next(self.iterable)
+            elif self.exception_to_raise is not None:
+                exc, self.exception_to_raise = self.exception_to_raise, None
+                requirements = self.iterable.throw(*exc)
+            else:
+                results, self.dependency_results = self.dependency_results, None
+                requirements = self.iterable.send(results)
         except StopIteration as e:
             self.result = getattr(e, 'value', None)
             self.iteration = -1
@@ -57,100 +95,176 @@ class _PendingRunnable(object):
             return None
 
         if requirements is None:
-            requirements = []
-
-        dependencies = None
-        if isinstance(requirements, dict):
-            dependencies = requirements
-            self.dependency_results = {}
-            self.dependency_completed = partial(self._depencency_completed_list_or_dict, self.iteration)
-        elif isinstance(requirements, (list, set, frozenset, tuple)):
-            dependencies = dict(enumerate(requirements))
-            self.dependency_results = [None] * len(dependencies)
-            self.dependency_completed = partial(self._depencency_completed_list_or_dict, self.iteration)
-        else:
-            dependencies = {'': requirements}
-            self.dependency_results = None
-            self.dependency_completed = partial(self._dependency_completed_single, self.iteration)
-
-        self.dependency_threw = partial(self._dependency_threw, self.iteration)
-        self.dependencies_remaining = len(dependencies)
-        return dependencies
+            return ()
+        return requirements
 
-    def _depencency_completed_list_or_dict(self, iteration, loop, k, v):
+    def dependency_completed(self, loop, iteration, key, value):
         if self.iteration != iteration:
             return
 
-        self.dependency_results[k] = v
-        self.dependencies_remaining -= 1
-        if self.ready:
-            loop.runnable(self)
-
-    def _dependency_completed_single(self, iteration, loop, _, v):
-        if self.iteration != iteration:
-            return
+        if key is _NO_KEY:
+            self.dependency_results = value
+        else:
+            self.dependency_results[key] = value
 
-        self.dependency_results = v
         self.dependencies_remaining -= 1
         if self.ready:
-            loop.runnable(self)
+            loop.run_queue.append(self)
 
-    def _dependency_threw(self, iteration, loop, _, type_, value, traceback):
+    def dependency_threw(self, loop, iteration, type_, value, traceback):
         if self.iteration != iteration:
             return
 
+        if self.dependencies_remaining > 1:
+            # Siblings are still running and will report back into this
+            # object; it must never be handed out again.
+            self.recyclable = False
+            loop.abandoned = True
+
         self.exception_to_raise = (type_, value, traceback)
         self.iteration += 1
         self.dependencies_remaining = 0
 
         if self.ready:
-            loop.runnable(self)
-
-    dependency_completed = None  # dynamically changed.
-    dependency_threw = None
+            loop.run_queue.append(self)
 
     @property
     def ready(self):
         return self.dependencies_remaining == 0 and getattr(self.iterable, 'ready', True)
 
-LOCAL_ID = 0
-def new_local_id():
-    global LOCAL_ID
-    LOCAL_ID += 1
-    return LOCAL_ID
+# Finished runnables are kept around for reuse, up to this many per loop.
+MAX_FREE_RUNNABLES = 1024
+
+# How deep coroutines may be stepped eagerly inside their parent's step before
+# falling back to the run queue; this bounds the python stack depth.
+MAX_EAGER_DEPTH = 32
 
 class RunLoop(object):
+    # Whether the loop runs bare `async def` coroutine objects itself. Loops
+    # driven by another event loop (batchy.asyncio) only run the ones made
+    # for batchy (see _owned), and hand the rest to wrap_dependency.
+    runs_coroutines = True
+
     def __init__(self):
-        self.locals = dict()
+        self.locals = dict()  # {RunLoopLocal: {attribute: value}}
 
         self.run_queue = deque()
         self.total_pending = 0
         self.main_runnable = None
+        self.free_runnables = []
+        self.eager_depth = 0
+        # The batchy.context context of the runnable being run, or of the
+        # main runnable in between runnables.
+        self.context = None
+        # Absolute time (clock()) by which run() must be done, if any.
+        self.deadline = None
+        self.timers = []  # heap of (clock() time, sequence number, fn)
+        self.timers_added = 0
+        # Set when runnables get cut off from whoever waited on them (a
+        # sibling raised, a future timed out), until the reactor has looked
+        # for operations it no longer needs to wait for.
+        self.abandoned = False
+
+        self.rounds = 0
+        self.steps = 0
+        self.stats = stats.LoopStats() if stats.ENABLED else None
 
         self.on_queue_exhausted = blinker.Signal()
         self.on_runnable_added = blinker.Signal()
         self.on_iteration = blinker.Signal()
 
-    def run(self, iterable):
-        self.main_runnable = self.add(iterable)
+        self.tracer = None
+        tracer = trace.current_tracer()
+        if tracer is not None:
+            tracer.attach(self)
 
-        while self.total_pending:
-            assert self.run_queue
-            self.on_iteration.send()
+        self.profiler = None
+        active_profiler = profiler.current_profiler()
+        if active_profiler is not None:
+            active_profiler.attach(self)
 
-            self._run_all_runnables()
+    def run(self, iterable):
+        self.main_runnable = self.add(iterable)
+        self.context = self.main_runnable.context
 
-            if self.total_pending:
-                self.on_queue_exhausted.send()
+        deadline = self.deadline
+        timers = self.timers
+        try:
+            while self.total_pending:
+                assert self.run_queue
+                self._run_round()
+
+                # Between rounds, so timers fire even while batches keep the
+                # loop from ever waiting on the reactor.
+                if timers and timers[0][0] <= clock():
+                    self.fire_timers()
+                if deadline is not None and self.total_pending and clock() >= deadline:
+                    raise Timeout('Run loop deadline passed with %d runnables pending' % (
+                        self.total_pending))
+        finally:
+            self._finished()
 
         if self.main_runnable.result_exception:
             reraise(*self.main_runnable.result_exception)
         return self.main_runnable.result
 
+    def _finished(self):
+        """Reports the loop as done to its stats and tracer, also when it
+        stops early (e.g. at its deadline)."""
+        if self.stats is not None:
+            stats.loop_finished(self)
+        if self.tracer is not None:
+            self.tracer.loop_finished(self)
+
+    def _run_round(self):
+        self.rounds += 1
+        if self.tracer is not None:
+            self.tracer.round_started(self)
+        self.on_iteration.send()
+
+        self._run_all_runnables()
+
+        if self.total_pending:
+            self.on_queue_exhausted.send()
+
+    def wrap_dependency(self, dependency):
+        """Hook for loops that understand more than coroutines & deferreds.
+
+        Called with everything yielded (or .add()-ed) that isn't a plain
+        generator or batchy coroutine; returns what the loop should run in
+        its place."""
+        return dependency
+
+    def call_later(self, delay, fn):
+        """Calls fn() from the loop once `delay` seconds have passed, waking
+        the loop up if it is blocked waiting."""
+        from .reactor import REACTOR
+        self.timers_added += 1
+        heapq.heappush(self.timers, (clock() + delay, self.timers_added, fn))
+        REACTOR.reactor.wait_for_timers()
+
+    def fire_timers(self):
+        """Calls the functions of timers that are due."""
+        timers = self.timers
+        now = clock()
+        while timers and timers[0][0] <= now:
+            heapq.heappop(timers)[2]()
+
     def add(self, iterable, callback_ok=None, callback_exc=None):
+        context = self.context
+        if type(iterable) is not GeneratorType:
+            if type(iterable) is _InContext:
+                if iterable.context is not CALLER_CONTEXT:
+                    context = iterable.context
+                iterable = iterable.iterable
+                if type(iterable) is not GeneratorType and type(iterable) is not CoroutineType:
+                    iterable = self.wrap_dependency(iterable)
+            elif type(iterable) is not CoroutineType or not self.runs_coroutines:
+                iterable = self.wrap_dependency(iterable)
         callback_ok = callback_ok or noop
         callback_exc = callback_exc or noop
-        obj = _PendingRunnable(iterable, callback=callback_ok, callback_exc=callback_exc)
+        obj = _PendingRunnable(iterable, callback=callback_ok, callback_exc=callback_exc,
+                               context=context)
         self.total_pending += 1
         if obj.ready:
             self.run_queue.append(obj)
@@ -158,35 +272,221 @@ class RunLoop(object):
         if hasattr(iterable, 'on_add_to_loop'):
             iterable.on_add_to_loop(self, obj)
 
-        self.on_runnable_added.send(runnable=obj)
+        if self.on_runnable_added.receivers:
+            self.on_runnable_added.send(runnable=obj)
         return obj
 
+    def _add_dependency(self, iterable, parent, parent_iteration, key):
+        """Like .add(), but reports the result straight back into `parent`
+        instead of going through callbacks.
+
+        Deferreds that are already resolved never get a runnable, and plain
+        coroutines are stepped right away instead of waiting for their turn
+        in the run queue; coroutines that finish without yielding (cache
+        hits, coro_return helpers) cost about as much as a function call."""
+        context = parent.context
+        iterable_type = type(iterable)
+        if iterable_type is not GeneratorType and (iterable_type is not CoroutineType or
+                                                   not self.runs_coroutines):
+            if iterable_type is _InContext:
+                if iterable.context is not CALLER_CONTEXT:
+                    context = iterable.context
+                iterable = iterable.iterable
+                iterable_type = type(iterable)
+                if iterable_type is not GeneratorType and iterable_type is not CoroutineType:
+                    iterable = self.wrap_dependency(iterable)
+                    iterable_type = type(iterable)
+            else:
+                iterable = self.wrap_dependency(iterable)
+                iterable_type = type(iterable)
+
+        if iterable_type is _DeferredIterable and iterable.ready:
+            if iterable.exception is None:
+                parent.dependency_completed(self, parent_iteration, key, iterable.value)
+            else:
+                parent.dependency_threw(self, parent_iteration, *iterable.exception)
+            return
+
+        free_runnables = self.free_runnables
+        if free_runnables:
+            obj = free_runnables.pop()
+            obj._reset(iterable, parent, parent_iteration, key, None, None, context)
+        else:
+            obj = _PendingRunnable(iterable, parent, parent_iteration, key, context=context)
+        self.total_pending += 1
+
+        if iterable_type is GeneratorType or iterable_type is CoroutineType:
+            # Plain generators are always ready and nobody else holds on to
+            # their runnable.
+            eager = obj.recyclable = True
+        else:
+            eager = getattr(iterable, 'ready', True)
+
+            if hasattr(iterable, 'on_add_to_loop'):
+                iterable.on_add_to_loop(self, obj)
+                eager = False
+            else:
+                obj.recyclable = True
+
+        if self.on_runnable_added.receivers:
+            obj.recyclable = False
+            self.on_runnable_added.send(runnable=obj)
+
+        if eager and self.eager_depth < MAX_EAGER_DEPTH:
+            self.eager_depth += 1
+            self._run(obj)
+            self.eager_depth -= 1
+        elif obj.ready:
+            self.run_queue.append(obj)
+
+    def _add_dependencies(self, runnable, requirements):
+        """Schedules everything `runnable` yielded. Returns True if all of it
+        was resolved on the spot, in which case `runnable` can be stepped
+        again right away."""
+        iteration = runnable.iteration
+        add_dependency = self._add_dependency
+
+        # Hold one extra count while scheduling so a dependency that finishes
+        # synchronously doesn't queue the runnable by itself.
+        if isinstance(requirements, (dict, list, tuple, set, frozenset)) and not requirements:
+            # A bare yield (or a yield of nothing) lets the rest of the queue
+            # run first, e.g. so siblings being polled for can make progress.
+            runnable.dependency_results = {} if isinstance(requirements, dict) else []
+            runnable.dependencies_remaining = 0
+            self.run_queue.append(runnable)
+            return False
+        if isinstance(requirements, dict):
+            runnable.dependency_results = {}
+            runnable.dependencies_remaining = len(requirements) + 1
+            for k, v in iteritems(requirements):
+                add_dependency(v, runnable, iteration, k)
+        elif isinstance(requirements, (list, tuple, set, frozenset)):
+            runnable.dependency_results = [None] * len(requirements)
+            runnable.dependencies_remaining = len(requirements) + 1
+            for k, v in enumerate(requirements):
+                add_dependency(v, runnable, iteration, k)
+        else:
+            runnable.dependencies_remaining = 2
+            add_dependency(requirements, runnable, iteration, _NO_KEY)
+
+        if runnable.iteration != iteration:
+            return False  # A dependency threw; the runnable has been queued.
+
+        runnable.dependencies_remaining -= 1
+        return runnable.ready
+
+    def _complete(self, runnable):
+        parent = runnable.parent
+        if parent is not None:
+            if runnable.result_exception is None:
+                parent.dependency_completed(self, runnable.parent_iteration,
+                                            runnable.key, runnable.result)
+            else:
+                parent.dependency_threw(self, runnable.parent_iteration,
+                                        *runnable.result_exception)
+
+            if runnable.recyclable and len(self.free_runnables) < MAX_FREE_RUNNABLES:
+                # Drops everything the finished call referenced (including
+                # a traceback's frames) until the runnable is reused.
+                runnable.iterable = runnable.result = runnable.result_exception = None
+                runnable.parent = runnable.context = None
+                self.free_runnables.append(runnable)
+        elif runnable.result_exception:
+            runnable.callback_exc(*runnable.result_exception)
+        else:
+            runnable.callback(runnable.result)
+
+        self.total_pending -= 1
+
     def runnable(self, runnable):
         """Notify the context that routine is runnable. This assumes that
         .add() was already called with this iterable."""
         assert isinstance(runnable, _PendingRunnable)
         self.run_queue.append(runnable)
 
+    def _cancel(self, runnable):
+        """Finishes `runnable` without stepping it, closing its generator (which
+        raises GeneratorExit at its yield, running finally: blocks). Its own
+        pending dependencies get cancelled as they come up, since it no longer
+        waits on them."""
+        close = getattr(runnable.iterable, 'close', None)
+        if close is not None:
+            try:
+                close()
+            except Exception:
+                pass
+        if runnable.dependencies_remaining:
+            runnable.recyclable = False
+            self.abandoned = True
+        runnable.iteration = -1
+        self._complete(runnable)
+
+    def _run(self, runnable):
+        """Steps `runnable` for as long as its dependencies resolve immediately."""
+        parent = runnable.parent
+        if parent is not None:
+            if parent.iteration != runnable.parent_iteration:
+                self._cancel(runnable)  # E.g. a sibling raised.
+                return
+        elif runnable.callback is _orphaned:
+            self._cancel(runnable)
+            return
+
+        previous_context, self.context = self.context, runnable.context
+        step = self._step
+        while True:
+            self.steps += 1
+            requirements = step(runnable)
+            if requirements is None:
+                self._complete(runnable)
+                break
+            if not self._add_dependencies(runnable, requirements):
+                break
+        self.context = previous_context
+
+    def _step(self, runnable):
+        """Advances `runnable` once; the profiler replaces this to time steps."""
+        return runnable.step()
+
     def _run_all_runnables(self):
-        while self.run_queue:
-            runnable = self.run_queue.popleft()
-            deps = runnable.step()
-            if deps is None:
-                if runnable.result_exception:
-                    runnable.callback_exc(*runnable.result_exception)
-                elif runnable.callback is not None:
-                    runnable.callback(runnable.result)                    
-                    
-                self.total_pending -= 1
-                continue
-
-            for k, v in iteritems(deps):
-                self.add(v,
-                         partial(runnable.dependency_completed, self, k),
-                         partial(runnable.dependency_threw, self, k))
-
-            if runnable.ready:
-                self.run_queue.append(runnable)
+        run_queue = self.run_queue
+        run = self._run
+        while run_queue:
+            run(run_queue.popleft())
+
+def orphaned(runnable):
+    """Returns True if nothing waits for `runnable`'s result anymore: one of
+    the coroutines it reports to (directly or through others) has moved on
+    without it, or it runs a future() that timed out."""
+    parent = runnable.parent
+    while parent is not None:
+        if parent.iteration != runnable.parent_iteration:
+            return True
+        runnable, parent = parent, parent.parent
+    return runnable.callback is _orphaned
+
+def _abandoned(d):
+    """Returns True if no coroutine waits on deferred `d` anymore. For a list
+    of deferreds, or a deferred standing in for several (with .deferreds),
+    only once none of them is waited on."""
+    group = d if type(d) is list else getattr(d, 'deferreds', None)
+    if group is not None:
+        return all(_abandoned(member) for member in group)
+    return d.runnable is not None and orphaned(d.runnable)
+
+def _drop_abandoned(items, deferreds):
+    """Fails the deferreds (see _abandoned) of `items` that nothing waits on
+    anymore with Cancelled, which unwinds the coroutines left waiting on
+    them. Returns the remaining items and the dropped ones."""
+    live, dropped = [], []
+    for item, d in zip(items, deferreds):
+        if _abandoned(d):
+            for member in (d if type(d) is list else [d]):
+                member.set_exception(Cancelled, Cancelled(), None)
+            dropped.append(item)
+        else:
+            live.append(item)
+    return live, dropped
 
 class _ThreadingLocalRunLoop(local):
     loop = None
@@ -196,6 +496,11 @@ _CURRENT_RUN_LOOP = _ThreadingLocalRunLoop()
 def current_run_loop():
     return _CURRENT_RUN_LOOP.loop
 
+def _set_current_run_loop(loop):
+    """Makes `loop` the current run loop; returns the one it replaced."""
+    previous, _CURRENT_RUN_LOOP.loop = _CURRENT_RUN_LOOP.loop, loop
+    return previous
+
 def use_threading_local():
     assert current_run_loop() is None
 
@@ -217,28 +522,64 @@ else:
         global _CURRENT_RUN_LOOP
         _CURRENT_RUN_LOOP = _GeventLocalRunLoop()
 
-def runloop_coroutine():
+def runloop_coroutine(deadline=None):
     """Creates a coroutine that gets run in a run loop.
 
-    The run loop will be created if necessary."""
+    The run loop will be created if necessary. `fn` may be a generator
+    function or an `async def` function.
+
+    With `deadline` (in seconds), a call that creates the run loop raises
+    Timeout if the loop isn't done in time; calls made inside a running loop
+    raise Timeout in their caller instead, as with future(..., timeout=)."""
     def wrap(fn):
         @wraps(fn)
         def wrapper(*args, **kwargs):
             if _CURRENT_RUN_LOOP.loop:
                 it = fn(*args, **kwargs)
-                assert is_nextable(it), '%s did not return an iterator' % (fn)
+                if type(it) is CoroutineType:
+                    it = _InContext(it, CALLER_CONTEXT)  # See _owned.
+                assert is_nextable(it) or is_coroutine(it) or type(it) is _InContext, \
+                    '%s did not return an iterator' % (fn)
+                if deadline is not None:
+                    return _with_timeout(it, deadline)
                 return it
             else:
+                from . import diagnostics
+                if diagnostics.ENABLED:
+                    diagnostics.loop_entered()
+
                 _CURRENT_RUN_LOOP.loop = loop = RunLoop()
+                if deadline is not None:
+                    loop.deadline = clock() + deadline
                 try:
                     it = fn(*args, **kwargs)
-                    assert is_nextable(it), '%s did not return an iterator' % (fn)
+                    assert is_nextable(it) or is_coroutine(it) or type(it) is _InContext, \
+                        '%s did not return an iterator' % (fn)
                     return loop.run(it)
                 finally:
                     _CURRENT_RUN_LOOP.loop = None
         return wrapper
     return wrap
 
+def run_in_new_loop(fn, *args, **kwargs):
+    """Runs the coroutine fn(*args, **kwargs) to completion in a fresh run
+    loop, even if one is already running (e.g. in a greenlet spawned from it)."""
+    loop = RunLoop()
+    previous = _set_current_run_loop(loop)
+    try:
+        return loop.run(fn(*args, **kwargs))
+    finally:
+        _set_current_run_loop(previous)
+
+def remaining_time():
+    """Returns the seconds left before the current run loop's deadline, or
+    None if it has none. Batch functions can use this to time out their
+    backend calls."""
+    loop = _CURRENT_RUN_LOOP.loop
+    if loop is None or loop.deadline is None:
+        return None
+    return max(0.0, loop.deadline - clock())
+
 def requires_runloop():
     """Same as @runloop_coroutine, but refuses to create a loop if one is not present."""
     def wrap(fn):
@@ -252,6 +593,74 @@ def requires_runloop():
 def coro_return(value):
     raise StopIterationWithValue(value)
 
+class _Awaitable(object):
+    """Yields `requirements` to the run loop once when awaited, and returns
+    whatever the run loop sends back."""
+    __slots__ = ('requirements', 'yielded')
+
+    def __init__(self, requirements):
+        self.requirements = requirements
+        self.yielded = False
+
+    def __await__(self):
+        return self
+    __iter__ = __await__
+
+    def __next__(self):
+        return self.send(None)
+    next = __next__
+
+    def send(self, value):
+        if self.yielded:
+            raise StopIteration(value)
+
+        self.yielded = True
+        return self.requirements
+
+    def throw(self, type_, value=None, traceback=None):
+        if value is None:
+            value = type_() if isinstance(type_, type) else type_
+        reraise(type(value), value, traceback)
+
+CALLER_CONTEXT = object()
+
+def _owned(it):
+    """Marks `it`, if it's a native coroutine, as made for batchy (rather
+    than for another event loop), so every run loop runs it itself."""
+    if type(it) is CoroutineType:
+        return _InContext(it, CALLER_CONTEXT)
+    return it
+
+class _InContext(object):
+    """Makes the run loop run `iterable` in `context` (see batchy.context),
+    or with CALLER_CONTEXT, in the context of whatever yields it. Unlike bare
+    generators, these can be awaited."""
+    __slots__ = ('iterable', 'context')
+
+    def __init__(self, iterable, context):
+        self.iterable = iterable
+        self.context = context
+
+    def __await__(self):
+        return _Awaitable(self)
+
+def awaitable(requirements):
+    """The `await` version of `yield`, for use in `async def` coroutines:
+
+    a, b = await awaitable([get_a(), get_b()])
+    things = await awaitable({k: get_thing(k) for k in keys})
+
+    This also works for single generator coroutines and the helpers below:
+
+    d = await awaitable(deferred())
+    thing_later = await awaitable(future(get_thing()))
+    ready = await awaitable(wait([a, b], count=1))
+
+    Deferreds (including futures) and @coroutine/@batch_coroutine calls can
+    be awaited directly.
+    """
+    return _Awaitable(requirements)
+
 class _DeferredIterable(object):
     def __init__(self):
         self.value = None
@@ -291,6 +700,9 @@ class _DeferredIterable(object):
         coro_return(self.get())
     next = __next__
 
+    def __await__(self):
+        return _Awaitable(self)
+
     def get(self):
         if __debug__:
             if not self.ready:
@@ -307,7 +719,7 @@ def deferred():
 
 
 @requires_runloop()
-def future(iterable):
+def future(iterable, timeout=None):
     """Given an iterable, this returns an object that can be yielded again once
     you want to use it's value. This is useful to "front-load" some expensive
     calls that you don't need the results of immediately.
@@ -326,12 +738,29 @@ def future(iterable):
             a_thing = None  # it's ok we don't need it anyway
 
         b_thing, c_thing = yield b, c
+
+    With `timeout` (in seconds), the future raises Timeout if `iterable`
+    isn't done in time, and whatever it was still doing is cancelled.
     """
 
     result = yield deferred()
-    current_run_loop().add(iterable, result.set_value, result.set_exception)
+    loop = current_run_loop()
+    runnable = loop.add(iterable, result.set_value, result.set_exception)
+    if timeout is not None:
+        loop.call_later(timeout, partial(_time_out, loop, runnable, result, timeout))
     coro_return(result)
 
+def _time_out(loop, runnable, d, timeout):
+    if not d.ready:
+        runnable.callback = runnable.callback_exc = _orphaned
+        loop.abandoned = True
+        d.set_exception(Timeout, Timeout('Timed out after %ss' % (timeout,)), None)
+
+@runloop_coroutine()
+def _with_timeout(it, timeout):
+    result = yield future(it, timeout)
+    coro_return((yield result))
+
 @requires_runloop()
 def wait(deferreds, count=None):
     """iwait(deferreds_or_futures, count=None).
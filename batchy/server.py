@@ -0,0 +1,243 @@
+"""A run loop shared by many threads, batching calls across requests.
+
+Every top-level @runloop_coroutine call runs in a loop of its own, so only
+calls made while handling the same request end up in a batch together. A
+SharedRunLoop instead runs one long-lived loop in a thread of its own;
+request threads hand it coroutines and block until their result is ready:
+
+    SHARED_LOOP = batchy.server.SharedRunLoop(linger=0.002, max_items=500)
+    SHARED_LOOP.start()
+
+    def handle(request):
+        return SHARED_LOOP.call(render_page, request)
+
+Before batches made by newly arrived calls go out, the loop lingers - for
+up to `linger` seconds, or until `max_items` calls are queued across all
+batches - so that calls from other requests can join them. With gevent's
+monkey patching the loop's thread is a greenlet, and this works per hub.
+
+Calls share the loop's RunLoopLocals, but each call gets CallLocals of its
+own (see batchy.local): memoized_coroutine and cache_per_loop results last
+until the call finishes, like they would in a loop of its own. Loop-wide
+CallLocal values, used by coroutines outside of any call (e.g. batch
+functions), are dropped every time queued batches go out.
+
+The shared loop only finishes when it is stopped. Its stats (batchy.stats)
+are added to the process-wide totals as calls finish, and count as a single
+loop; tracers (batchy.trace) only see it finish once it stops.
+"""
+from __future__ import absolute_import
+
+from functools import partial
+import sys
+import threading
+
+from .batch_coroutine import BATCH_MANAGER
+from .compat import reraise
+from .context import _Context
+from .hook import add_hook
+from .local import CallLocal
+from .reactor import REACTOR
+from .runloop import (RunLoop, Timeout, runloop_coroutine, current_run_loop, deferred,
+                      coro_return, _set_current_run_loop, _InContext, CALLER_CONTEXT, clock)
+from . import stats
+
+# Above batches, so lingering happens before they are dispatched.
+LINGER_HOOK_PRIORITY = 15
+
+def _drop_loop_call_locals(loop):
+    for local in [local for local in loop.locals if issubclass(type(local), CallLocal)]:
+        del loop.locals[local]
+
+class _Call(object):
+    """A call handed to the shared loop; result() blocks until it's done."""
+    def __init__(self, fn, args, kwargs):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.value = None
+        self.exception = None
+        self.done = threading.Event()
+
+    def set_value(self, value):
+        self.value = value
+        self.done.set()
+
+    def set_exception(self, type_, value, traceback):
+        self.exception = (type_, value, traceback)
+        self.done.set()
+
+    def result(self, timeout=None):
+        if not self.done.wait(timeout):
+            raise Timeout('Call to %r still running after %ss' % (self.fn, timeout))
+        if self.exception is not None:
+            reraise(*self.exception)
+        return self.value
+
+class SharedRunLoop(object):
+    def __init__(self, linger=0.002, max_items=None):
+        self.linger = linger
+        self.max_items = max_items
+
+        self.condition = threading.Condition()
+        self.inbox = []  # _Calls not started yet
+        self.running = set()  # _Calls taken from the inbox but not done yet
+        self.receiver = None  # (reactor, deferred) the loop is waiting on, if any
+        self.stopping = False
+        self.thread = None
+        self.window_end = None  # When the current linger window closes.
+
+    def start(self):
+        """Starts the loop in a (daemon) thread of its own."""
+        assert self.thread is None, 'Shared run loop already started'
+        self.thread = threading.Thread(target=self._run, name='batchy-shared-loop')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self, timeout=None):
+        """Finishes the calls already handed over, then stops the loop."""
+        self._wake(stop=True)
+        self.thread.join(timeout)
+
+    def submit(self, fn, *args, **kwargs):
+        """Starts fn(*args, **kwargs), a coroutine function, in the shared
+        loop. Returns an object whose result() blocks until it's done, and
+        raises Timeout if it isn't by the time its `timeout` passes."""
+        assert self.thread is not None, 'Shared run loop not started'
+        assert threading.current_thread() is not self.thread, \
+            'Yield coroutines instead of calling them from inside the shared loop'
+
+        call = _Call(fn, args, kwargs)
+        self._wake(call=call)
+        return call
+
+    def call(self, fn, *args, **kwargs):
+        """Runs fn(*args, **kwargs) in the shared loop and returns its result."""
+        return self.submit(fn, *args, **kwargs).result()
+
+    def _wake(self, call=None, stop=False):
+        with self.condition:
+            if call is not None:
+                if self.stopping:
+                    raise RuntimeError('Shared run loop stopped')
+                self.inbox.append(call)
+            if stop:
+                self.stopping = True
+            receiver, self.receiver = self.receiver, None
+            self.condition.notify()
+
+        if receiver is not None:
+            reactor, d = receiver
+            reactor.complete('request', d, self._take, None)
+
+    def _take(self, _=None):
+        """Returns the calls that arrived since the last time, or None once
+        stopping with nothing left."""
+        with self.condition:
+            calls, self.inbox = self.inbox, []
+            if not calls and self.stopping:
+                return None
+            self.running.update(calls)
+            return calls
+
+    def _run(self):
+        loop = RunLoop()
+        _set_current_run_loop(loop)
+        try:
+            loop.run(self._serve())
+        except Exception:
+            # Nothing will finish the calls the loop had, or take new ones.
+            exc_info = sys.exc_info()
+            with self.condition:
+                self.stopping = True
+                calls, self.inbox = self.inbox, []
+            for call in list(self.running) + calls:
+                call.set_exception(*exc_info)
+            self.running.clear()
+            raise
+        finally:
+            _set_current_run_loop(None)
+
+    @runloop_coroutine()
+    def _serve(self):
+        while True:
+            calls = yield self._receive()
+            if calls is None:
+                break
+            self._start(calls)
+
+    @runloop_coroutine()
+    def _receive(self):
+        d = yield deferred()
+        with self.condition:
+            if self.inbox or self.stopping:
+                d.set_value(self._take())
+            else:
+                reactor = REACTOR.reactor
+                reactor.add('request', d)
+                self.receiver = (reactor, d)
+        coro_return((yield d))
+
+    def _start(self, calls):
+        loop = current_run_loop()
+        for call in calls:
+            try:
+                it = call.fn(*call.args, **call.kwargs)
+            except Exception:
+                self._finished(call, call.set_exception, *sys.exc_info())
+                continue
+
+            # Runs the call in a context holding its CallLocals. Coroutines
+            # that begin a context of their own already got a fresh one.
+            if type(it) is not _InContext:
+                it = _InContext(it, _Context())
+            elif it.context is CALLER_CONTEXT:
+                it.context = _Context()
+            it.context.call_locals = {}
+            loop.add(it, partial(self._finished, call, call.set_value),
+                     partial(self._finished, call, call.set_exception))
+
+        if calls:
+            add_hook(LINGER_HOOK_PRIORITY, self._on_queue_exhausted)
+
+    def _finished(self, call, callback, *args):
+        self.running.discard(call)
+        loop = current_run_loop()
+        if loop.stats is not None:
+            stats.loop_finished(loop, loops=0)
+        callback(*args)
+
+    def _on_queue_exhausted(self):
+        current_run_loop().add(self._linger())
+
+    @runloop_coroutine()
+    def _linger(self):
+        """Holds queued batches back until the linger window closes, starting
+        the calls that arrive meanwhile so their batch calls join in."""
+        pending = BATCH_MANAGER.batch_manager.pending_batches
+        if not pending:
+            self.window_end = None
+            return
+
+        now = clock()
+        if self.window_end is None:
+            self.window_end = now + self.linger
+        items = sum(len(args) for _, _, args, _ in pending.values())
+
+        if now < self.window_end and (self.max_items is None or items < self.max_items):
+            with self.condition:
+                while not self.inbox and not self.stopping:
+                    remaining = self.window_end - clock()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+
+            calls = self._take()
+            if calls:
+                self._start(calls)  # Lingers again once they've run.
+                return
+
+        self.window_end = None
+        _drop_loop_call_locals(current_run_loop())
+        return
+        yield  # pragma: no cover
@@ -0,0 +1,132 @@
+"""Counters for run loops, batches and blocking waits.
+
+Collection is off by default. Once enabled, every new run loop gets a
+LoopStats in .stats, which is added to a process-wide total when the loop
+finishes:
+
+    batchy.stats.enable()
+    ...
+    for name, value in batchy.stats.snapshot().items():
+        metrics.gauge('batchy.' + name, value)
+
+Batch counters are keyed by the batch function's name, e.g.
+'batches.myapp.models.get_users'.
+"""
+from threading import Lock
+import time
+
+ENABLED = False
+
+def enable():
+    """Collects stats for run loops created from now on."""
+    global ENABLED
+    ENABLED = True
+
+def disable():
+    global ENABLED
+    ENABLED = False
+
+# Same monotonic clock as batchy.runloop's deadlines, where there is one.
+clock = getattr(time, 'monotonic', time.time)
+
+class LoopStats(object):
+    def __init__(self, first_round=0, first_step=0):
+        self.loops = 0
+        self.rounds = 0
+        self.steps = 0
+        # The loop's rounds & steps before these stats started counting.
+        self.first_round = first_round
+        self.first_step = first_step
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.batches = {}  # {name: [dispatches, items, seconds]}
+
+    def record_batch(self, name, items, seconds):
+        entry = self.batches.get(name)
+        if entry is None:
+            entry = self.batches[name] = [0, 0, 0.0]
+        entry[0] += 1
+        entry[1] += items
+        entry[2] += seconds
+
+    def record_wait(self, seconds):
+        self.waits += 1
+        self.wait_seconds += seconds
+
+    def merge(self, other):
+        self.loops += other.loops
+        self.rounds += other.rounds
+        self.steps += other.steps
+        self.waits += other.waits
+        self.wait_seconds += other.wait_seconds
+        for name, (dispatches, items, seconds) in other.batches.items():
+            entry = self.batches.get(name)
+            if entry is None:
+                entry = self.batches[name] = [0, 0, 0.0]
+            entry[0] += dispatches
+            entry[1] += items
+            entry[2] += seconds
+
+    def as_dict(self):
+        """Flattens the counters into {name: number}."""
+        d = {
+            'loops': self.loops,
+            'rounds': self.rounds,
+            'steps': self.steps,
+            'waits': self.waits,
+            'wait_seconds': self.wait_seconds,
+        }
+        for name, (dispatches, items, seconds) in self.batches.items():
+            d['batches.%s.dispatches' % name] = dispatches
+            d['batches.%s.items' % name] = items
+            d['batches.%s.seconds' % name] = seconds
+        return d
+
+class _ProcessStats(object):
+    def __init__(self):
+        self.lock = Lock()
+        self.stats = LoopStats()
+
+    def add(self, loop_stats):
+        with self.lock:
+            self.stats.merge(loop_stats)
+
+    def snapshot(self, reset=False):
+        with self.lock:
+            stats = self.stats
+            if reset:
+                self.stats = LoopStats()
+            return stats.as_dict()
+
+PROCESS_STATS = _ProcessStats()
+
+def snapshot(reset=False):
+    """Returns the totals of all finished run loops as {name: number}.
+    With reset=True, starts counting from zero again."""
+    return PROCESS_STATS.snapshot(reset)
+
+def loop_finished(loop, loops=1):
+    """Called by run loops when they are done. Loops that never finish (like
+    batchy.server's shared loop) call this as they go instead, with how many
+    loops' worth of work they did meanwhile, and start counting again."""
+    stats = loop.stats
+    stats.loops = loops
+    stats.rounds = loop.rounds - stats.first_round
+    stats.steps = loop.steps - stats.first_step
+    PROCESS_STATS.add(stats)
+    loop.stats = LoopStats(loop.rounds, loop.steps)
+
+def record_wait(loop, start):
+    """Records a blocking wait in `loop` that began at `start`."""
+    if loop.stats is not None or loop.tracer is not None:
+        end = clock()
+        if loop.stats is not None:
+            loop.stats.record_wait(end - start)
+        if loop.tracer is not None:
+            loop.tracer.wait(start, end)
+
+def function_name(function):
+    """A readable name for a batch function."""
+    function = getattr(function, 'func', function)  # class_batch_coroutine partials
+    return '%s.%s' % (getattr(function, '__module__', None),
+                      getattr(function, '__name__', type(function).__name__))
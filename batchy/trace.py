@@ -0,0 +1,198 @@
+"""Records what run loops do, in Chrome's trace_event format.
+
+Sample usage:
+
+    with batchy.trace.tracing() as tracer:
+        render_page(request)
+    tracer.write('/tmp/page.json')  # open in chrome://tracing or ui.perfetto.dev
+
+Run loops created in this thread (or greenlet, with gevent's monkey
+patching) while tracing record:
+
+ - a span per round of the loop,
+ - a span per coroutine, from when it is first yielded to when it finishes,
+ - a span per batch function call (with its name and batch size),
+ - a span per blocking wait on futures or greenlets.
+
+Coroutines on the critical path - the chain of last-finishing dependencies
+that decided how long the loop took - are marked with critical: true; see
+also Tracer.critical_path().
+"""
+import json
+import os
+import threading
+import time
+
+# Same monotonic clock as batchy.runloop's deadlines, where there is one.
+clock = getattr(time, 'monotonic', time.time)
+
+_ACTIVE = threading.local()
+
+def current_tracer():
+    return getattr(_ACTIVE, 'tracer', None)
+
+_NAME_ARGUMENTS = {}  # {code: argument}
+
+def named_after(argument):
+    """Names the generators the decorated function returns after the
+    function passed to it as `argument`, e.g. batch calls after the batch
+    function."""
+    def wrap(fn):
+        _NAME_ARGUMENTS[fn.__code__] = argument
+        return fn
+    return wrap
+
+def coroutine_name(iterable):
+    """A readable name for something a run loop is running."""
+    code = getattr(iterable, 'gi_code', None) or getattr(iterable, 'cr_code', None)
+    if code is not None:
+        argument = _NAME_ARGUMENTS.get(code)
+        frame = getattr(iterable, 'gi_frame', None)
+        if argument is not None and frame is not None:
+            fn = frame.f_locals[argument]
+            fn = getattr(fn, 'func', fn)  # class_batch_coroutine partials
+            return getattr(fn, '__name__', code.co_name)
+        return code.co_name
+    if hasattr(iterable, 'set_value'):
+        return 'deferred'
+    return type(iterable).__name__
+
+class _Span(object):
+    __slots__ = ('id', 'name', 'parent', 'start', 'end', 'last_child')
+
+    def __init__(self, id_, name, parent, start):
+        self.id = id_
+        self.name = name
+        self.parent = parent
+        self.start = start
+        self.end = None
+        self.last_child = None
+
+class Tracer(object):
+    def __init__(self):
+        self.start = clock()
+        self.pid = os.getpid()
+        self.events = []
+        self.next_id = 0
+        self.open_spans = {}  # {id(runnable): _Span}
+        self.top_level_spans = {}  # {id(runnable): _Span} for runnables without a parent
+        self.roots = []  # Spans of each loop's main runnable.
+        self.round_start = {}  # {id(loop): (round, start)}
+
+    def _ts(self, t):
+        return (t - self.start) * 1e6
+
+    def _complete_event(self, name, cat, start, end, args=None):
+        self.events.append({
+            'name': name, 'cat': cat, 'ph': 'X', 'pid': self.pid,
+            'tid': threading.current_thread().ident,
+            'ts': self._ts(start), 'dur': (end - start) * 1e6, 'args': args or {},
+        })
+
+    def attach(self, loop):
+        """Starts recording `loop`."""
+        loop.tracer = self
+        loop.on_runnable_added.connect(self._on_runnable_added)
+
+        # Only traced loops pay for hearing about completed runnables.
+        complete = loop._complete
+        def traced_complete(runnable):
+            self._on_runnable_completed(runnable)
+            complete(runnable)
+        loop._complete = traced_complete
+
+    def _end_round(self, loop):
+        current = self.round_start.pop(id(loop), None)
+        if current is not None:
+            self._complete_event('round %d' % current[0], 'round', current[1], clock(),
+                                 {'loop': id(loop)})
+
+    def round_started(self, loop):
+        self._end_round(loop)
+        self.round_start[id(loop)] = (loop.rounds, clock())
+
+    def loop_finished(self, loop):
+        self._end_round(loop)
+        root = self.top_level_spans.pop(id(loop.main_runnable), None)
+        if root is not None:
+            self.roots.append(root)
+
+    def _on_runnable_added(self, _, runnable):
+        parent = self.open_spans.get(id(runnable.parent)) if runnable.parent else None
+        span = _Span(self.next_id, coroutine_name(runnable.iterable), parent, clock())
+        self.next_id += 1
+        self.open_spans[id(runnable)] = span
+        if parent is None:
+            self.top_level_spans[id(runnable)] = span
+
+    def _on_runnable_completed(self, runnable):
+        span = self.open_spans.pop(id(runnable), None)
+        if span is None:
+            return
+
+        span.end = clock()
+        parent = span.parent
+        if parent is not None and (parent.last_child is None or
+                                   parent.last_child.end <= span.end):
+            parent.last_child = span
+
+        args = {'parent': parent.id if parent is not None else None}
+        if runnable.result_exception is not None:
+            args['exception'] = repr(runnable.result_exception[1])
+        for ph, ts in (('b', span.start), ('e', span.end)):
+            self.events.append({
+                'name': span.name, 'cat': 'coroutine', 'ph': ph, 'id': span.id,
+                'pid': self.pid, 'tid': threading.current_thread().ident,
+                'ts': self._ts(ts), 'args': args if ph == 'b' else {},
+            })
+
+    def batch(self, name, size, start, end):
+        self._complete_event(name, 'batch', start, end, {'size': size})
+
+    def wait(self, start, end):
+        self._complete_event('wait', 'wait', start, end)
+
+    def critical_path(self):
+        """Returns the spans that decided how long each traced loop took, as
+        [[(name, start seconds, duration seconds), ...] per loop]."""
+        paths = []
+        for root in self.roots:
+            path = []
+            span = root
+            while span is not None and span.end is not None:
+                path.append((span.name, span.start - self.start, span.end - span.start))
+                span = span.last_child
+            paths.append(path)
+        return paths
+
+    def to_json(self):
+        critical = set()
+        for root in self.roots:
+            span = root
+            while span is not None:
+                critical.add(span.id)
+                span = span.last_child
+
+        for event in self.events:
+            if event['cat'] == 'coroutine' and event['ph'] == 'b' and event['id'] in critical:
+                event['args']['critical'] = True
+        return {'traceEvents': self.events, 'displayTimeUnit': 'ms'}
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_json(), f)
+
+class tracing(object):
+    """Traces run loops created in this thread until exit; `as` gives the
+    Tracer."""
+    def __init__(self, tracer=None):
+        self.tracer = tracer or Tracer()
+        self.previous = None
+
+    def __enter__(self):
+        self.previous = current_tracer()
+        _ACTIVE.tracer = self.tracer
+        return self.tracer
+
+    def __exit__(self, *exc_info):
+        _ACTIVE.tracer = self.previous
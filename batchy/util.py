@@ -1,17 +1,17 @@
 import sys
 
-from .local import RunLoopLocal
-from .runloop import deferred, coro_return, future
+from .local import CallLocal
+from .runloop import deferred, coro_return, future, _owned
 from .context import runloop_coroutine_with_context
 
-class _MemoizedLocal(RunLoopLocal):
+class _MemoizedLocal(CallLocal):
     def initialize(self):
         self.locals = {}
 _MEMOIZED = _MemoizedLocal()
 
 def memoized_coroutine(*d_args, **d_kwargs):
     """Use this on a coroutine that should be memoized for the duration of the
-    run loop.
+    run loop (or of the call, in a batchy.server.SharedRunLoop).
 
     For example, if you want to fetch a list, but do so only once per request,
     you can annotate the getter with @memoized_coroutine."""
@@ -22,7 +22,7 @@ def memoized_coroutine(*d_args, **d_kwargs):
         @runloop_coroutine_with_context()
         def do_call(args, kwargs, lst):
             try:
-                v = yield fn(*args, **kwargs)
+                v = yield _owned(fn(*args, **kwargs))
             except Exception:
                 for d in lst:
                     d.set_exception(*sys.exc_info())
@@ -44,10 +44,10 @@ def memoized_coroutine(*d_args, **d_kwargs):
                 cvalue = mgr[ckey] = [None, lst]
                 cvalue[0] = yield future(do_call(args, kwargs, lst))
 
-            d = yield deferred()
             if cvalue[0] is not None and cvalue[0].ready:
                 coro_return(cvalue[0].get())
             else:
+                d = yield deferred()
                 cvalue[1].append(d)
                 value = yield d
                 coro_return(value)
@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+"""Microbenchmarks for the run loop's hot paths.
+
+    ./benchmarks/run.py                           # run everything, print a table
+    ./benchmarks/run.py -k fanout --full          # only fan-out, up to 10^6 coroutines
+    ./benchmarks/run.py --output results.json     # save machine-readable results
+    ./benchmarks/run.py --baseline baseline.json  # exit with 1 on regressions
+
+Each benchmark runs a few times and keeps the fastest run. Results are
+compared per operation (e.g. per coroutine), so baselines recorded with
+--full still apply to shorter runs. Only compare against baselines recorded
+on the same machine & python version; that's why no baseline is checked in.
+Record one with --output before making a change.
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batchy.batch_coroutine import batch_coroutine
+from batchy.context import runloop_coroutine_with_context
+from batchy.local import RunLoopLocal
+from batchy.runloop import runloop_coroutine, coro_return
+from batchy.util import memoized_coroutine
+
+BENCHMARKS = []
+
+def benchmark(name, sizes, full_sizes=()):
+    """Registers fn(n) as a benchmark performing n operations."""
+    def wrap(fn):
+        BENCHMARKS.append((name, fn, tuple(sizes), tuple(full_sizes)))
+        return fn
+    return wrap
+
+@runloop_coroutine()
+def leaf(i):
+    coro_return(i)
+    yield
+
+@runloop_coroutine_with_context()
+def leaf_with_context(i):
+    coro_return(i)
+    yield
+
+@benchmark('fanout', [10 ** 3, 10 ** 4, 10 ** 5], [10 ** 6])
+@runloop_coroutine()
+def fanout(n):
+    yield [leaf(i) for i in range(n)]
+
+@benchmark('fanout_dict', [10 ** 4])
+@runloop_coroutine()
+def fanout_dict(n):
+    yield dict((i, leaf(i)) for i in range(n))
+
+@benchmark('fanout_list', [10 ** 4])
+@runloop_coroutine()
+def fanout_list(n):
+    yield [leaf(i) for i in range(n)]
+
+@benchmark('fanout_context', [10 ** 4])
+@runloop_coroutine()
+def fanout_context(n):
+    yield [leaf_with_context(i) for i in range(n)]
+
+@runloop_coroutine()
+def chain(depth):
+    if depth:
+        yield chain(depth - 1)
+
+@benchmark('deep_chain', [100, 1000])
+@runloop_coroutine()
+def deep_chain(n):
+    yield chain(n)
+
+@runloop_coroutine()
+def sequential(n):
+    for i in range(n):
+        yield leaf(i)
+
+@benchmark('sequential_yields', [10 ** 4])
+def sequential_yields(n):
+    sequential(n)
+
+@batch_coroutine(accepts_kwargs=False)
+def identity_batch(arg_lists):
+    coro_return([args[0] for args in arg_lists])
+    yield
+
+@benchmark('batch_one_round', [10, 1000], [10 ** 5])
+@runloop_coroutine()
+def batch_one_round(n):
+    yield [identity_batch(i) for i in range(n)]
+
+@runloop_coroutine()
+def batch_chain(rounds):
+    for i in range(rounds):
+        yield identity_batch(i)
+
+@benchmark('batch_rounds', [10 ** 3])
+@runloop_coroutine()
+def batch_rounds(n):
+    # n / 10 rounds of 10 calls.
+    yield [batch_chain(n // 10) for _ in range(10)]
+
+def _make_batch_function():
+    @batch_coroutine(accepts_kwargs=False)
+    def batch(arg_lists):
+        coro_return([args[0] for args in arg_lists])
+        yield
+    return batch
+
+BATCH_FUNCTIONS = [_make_batch_function() for _ in range(20)]
+
+@benchmark('many_batch_functions', [10 ** 3])
+@runloop_coroutine()
+def many_batch_functions(n):
+    # n rounds of calls to 20 different batch functions.
+    for i in range(n):
+        yield [fn(i) for fn in BATCH_FUNCTIONS]
+
+class _BenchLocal(RunLoopLocal):
+    def initialize(self):
+        self.value = 0
+_BENCH_LOCAL = _BenchLocal()
+
+@benchmark('runloop_local_access', [10 ** 5])
+@runloop_coroutine()
+def runloop_local_access(n):
+    local = _BENCH_LOCAL
+    for _ in range(n):
+        local.value
+    yield
+
+@memoized_coroutine()
+def memoized_leaf(i):
+    coro_return(i)
+    yield
+
+@benchmark('memoized_hits', [10 ** 4])
+@runloop_coroutine()
+def memoized_hits(n):
+    for _ in range(n):
+        yield memoized_leaf(1)
+
+def run_benchmarks(pattern=None, full=False, repeat=5):
+    results = {}
+    for name, fn, sizes, full_sizes in BENCHMARKS:
+        if pattern and pattern not in name:
+            continue
+
+        for n in sizes + (full_sizes if full else ()):
+            runs = repeat if n < 10 ** 6 else 1
+            best = float('inf')
+            for _ in range(runs):
+                start = time.time()
+                fn(n)
+                best = min(best, time.time() - start)
+
+            key = '%s[%d]' % (name, n)
+            results[key] = {'n': n, 'seconds': best, 'ns_per_op': best * 1e9 / n}
+            print('%-32s %10.4fs %10.0f ns/op' % (key, best, results[key]['ns_per_op']))
+            sys.stdout.flush()
+    return results
+
+def compare(results, baseline, threshold):
+    """Returns the names of benchmarks more than `threshold` (a fraction)
+    slower per operation than the baseline."""
+    regressions = []
+    for key, result in sorted(results.items()):
+        base = baseline.get(key)
+        if base is None:
+            continue
+
+        change = result['ns_per_op'] / base['ns_per_op'] - 1
+        flag = ''
+        if change > threshold:
+            regressions.append(key)
+            flag = '  REGRESSION'
+        print('%-32s %+7.1f%%%s' % (key, change * 100, flag))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run batchy microbenchmarks.')
+    parser.add_argument('-k', dest='pattern', help='only run benchmarks whose name contains this')
+    parser.add_argument('--full', action='store_true', help='include the largest (slow) sizes')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per benchmark (default: 5)')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--baseline',
+                        help='compare against results saved with --output on this machine '
+                        '& python version (none is checked in: timings from elsewhere '
+                        "don't compare)")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='fail when slower than the baseline by more than this '
+                        'fraction (default: 0.2)')
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.pattern, args.full, args.repeat)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'python': platform.python_version(),
+                       'implementation': platform.python_implementation(),
+                       'results': results}, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('python') != platform.python_version():
+            print('Warning: baseline was recorded with python %s' % baseline.get('python'))
+
+        print()
+        regressions = compare(results, baseline['results'], args.threshold)
+        if regressions:
+            print('%d benchmark(s) regressed by more than %d%%' % (
+                len(regressions), args.threshold * 100))
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
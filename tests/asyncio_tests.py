@@ -0,0 +1,174 @@
+import sys
+import time
+from unittest.case import SkipTest
+
+from batchy.runloop import coro_return, runloop_coroutine, current_run_loop, awaitable, future, Timeout
+from batchy.batch_coroutine import batch_coroutine
+
+try:
+    import asyncio
+
+    import batchy.asyncio as batchy_asyncio
+except ImportError:
+    batchy_asyncio = None
+    print('asyncio not available; skipping asyncio tests.')
+
+from . import BaseTestCase
+
+CALL_COUNT = 0
+
+@batch_coroutine()
+def increment(arg_lists):
+    def increment_single(n):
+        return n + 1
+
+    global CALL_COUNT
+    CALL_COUNT += 1
+    coro_return([increment_single(*ar, **kw) for ar, kw in arg_lists])
+    yield
+
+class AsyncioTests(BaseTestCase):
+    def setup(self):
+        if not batchy_asyncio:
+            raise SkipTest()
+
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+        global CALL_COUNT
+        CALL_COUNT = 0
+
+    def teardown(self):
+        if not batchy_asyncio:
+            return
+
+        asyncio.set_event_loop(None)
+        self.loop.close()
+
+    def run_batchy(self, fn, *args):
+        return self.loop.run_until_complete(batchy_asyncio.run(fn, *args))
+
+    def test_simple_awaitable(self):
+        @runloop_coroutine()
+        def test():
+            a, b = yield asyncio.sleep(0.01, result=1), increment(1)
+            coro_return(a + b)
+
+        self.assert_equals(3, self.run_batchy(test))
+
+    def test_asyncio_future(self):
+        @runloop_coroutine()
+        def test():
+            future = self.loop.create_future()
+            self.loop.call_later(0.01, future.set_result, 4)
+            v = yield future
+            coro_return(v)
+
+        self.assert_equals(4, self.run_batchy(test))
+
+    def test_exception(self):
+        def throw():
+            raise ValueError()
+
+        @runloop_coroutine()
+        def test():
+            yield self.loop.run_in_executor(None, throw)
+
+        self.assert_raises(ValueError, self.run_batchy, test)
+
+    def test_future_timeout(self):
+        @runloop_coroutine()
+        def test():
+            slow = yield future(asyncio.sleep(10), timeout=0.01)
+            try:
+                yield slow
+            except Timeout:
+                coro_return('timeout')
+
+        start = time.time()
+        self.assert_equals('timeout', self.run_batchy(test))
+        self.assert_true(time.time() - start < 1)
+
+    def test_deadline(self):
+        @runloop_coroutine()
+        def test():
+            yield asyncio.sleep(10)
+
+        result = batchy_asyncio.AsyncioRunLoop(self.loop, deadline=0.01).start(test)
+        self.assert_raises(Timeout, self.loop.run_until_complete, result)
+
+    def test_async_def(self):
+        if sys.version_info < (3, 5):
+            raise SkipTest()
+
+        ns = dict(globals())
+        exec("""
+@runloop_coroutine()
+async def sub(n):
+    await asyncio.sleep(0.01)
+    return await increment(n)
+
+@runloop_coroutine()
+async def test():
+    return await awaitable([sub(1), sub(2)])
+""", ns)
+
+        self.assert_equals([2, 3], self.run_batchy(ns['test']))
+        self.assert_equals(1, CALL_COUNT)
+
+    def test_foreign_coroutine(self):
+        if sys.version_info < (3, 5):
+            raise SkipTest()
+
+        ns = dict(globals())
+        exec("""
+current_task = getattr(asyncio, 'current_task', None) or asyncio.Task.current_task
+
+async def in_task(n):
+    await asyncio.sleep(0.01)
+    assert current_task() is not None
+    return n
+
+@runloop_coroutine()
+async def sub(n):
+    return await increment(await awaitable(in_task(n)))
+
+@runloop_coroutine()
+def test():
+    values = yield in_task(0), sub(1), sub(2)
+    coro_return(values)
+""", ns)
+
+        self.assert_equals([0, 2, 3], self.run_batchy(ns['test']))
+        self.assert_equals(1, CALL_COUNT)
+
+    def test_batch_after_await(self):
+        @runloop_coroutine()
+        def sub(n):
+            yield asyncio.sleep(0.01)
+            v = yield increment(n)
+            coro_return(v)
+
+        @runloop_coroutine()
+        def test():
+            v = yield sub(1), sub(2)
+            coro_return(v)
+
+        self.assert_equals([2, 3], self.run_batchy(test))
+        self.assert_equals(1, CALL_COUNT)
+
+    def test_concurrent_requests(self):
+        @runloop_coroutine()
+        def test(n):
+            assert current_run_loop() is not None
+            yield asyncio.sleep(0.1)
+            v = yield increment(n)
+            coro_return(v)
+
+        start = time.time()
+        results = self.loop.run_until_complete(asyncio.gather(
+            *[batchy_asyncio.run(test, i) for i in range(50)]))
+        self.assert_equals(list(range(1, 51)), results)
+        self.assert_true(time.time() - start < 1)
+        self.assert_equals(50, CALL_COUNT)  # Each request is its own loop.
+        self.assert_is_none(current_run_loop())
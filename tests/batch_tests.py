@@ -1,7 +1,11 @@
 import itertools
+import sys
+import time
+from unittest.case import SkipTest
 
-from batchy.runloop import coro_return, runloop_coroutine
-from batchy.batch_coroutine import batch_coroutine, class_batch_coroutine
+from batchy.runloop import coro_return, runloop_coroutine, future, current_run_loop, remaining_time, Timeout
+from batchy.batch_coroutine import (batch_coroutine, class_batch_coroutine, prime_loop_cache,
+                                    clear_loop_cache)
 
 from . import BaseTestCase
 
@@ -133,6 +137,31 @@ class BatchTests(BaseTestCase):
         self.assert_equal(0, client2.set_call_count)
         self.assert_equal(0, client2.run_call_count)
 
+    def test_rounds(self):
+        dispatch_rounds = []
+
+        @batch_coroutine(priority=-1)
+        def later(arg_lists):
+            dispatch_rounds.append(('later', current_run_loop().rounds))
+            coro_return([None] * len(arg_lists))
+            yield
+
+        @batch_coroutine(accepts_kwargs=False)
+        def record(arg_lists):
+            dispatch_rounds.append(('record', current_run_loop().rounds))
+            coro_return([None] * len(arg_lists))
+            yield
+
+        @runloop_coroutine()
+        def test():
+            yield [increment(i) for i in range(100)] + [record(i) for i in range(100)] + [later()]
+            coro_return(current_run_loop().rounds)
+
+        # Both priority 0 batches go out in one round, without a round per call.
+        self.assert_equals(3, test())
+        self.assert_equals([('record', 2), ('later', 3)], dispatch_rounds)
+        self.assert_equals(1, CALL_COUNT)
+
     def test_exception(self):
         client = BatchClient()
 
@@ -168,3 +197,303 @@ class BatchTests(BaseTestCase):
             yield action_1(), action_1(), action_2()
 
         self.assert_raises(ValueError, test)
+
+    def test_max_batch_size(self):
+        batches = []
+
+        @batch_coroutine(max_batch_size=3, accepts_kwargs=False)
+        def double(arg_lists):
+            batches.append([n for n, in arg_lists])
+            coro_return([n * 2 for n, in arg_lists])
+            yield
+
+        @runloop_coroutine()
+        def test():
+            values = yield [double(i) for i in range(8)]
+            coro_return(values)
+
+        self.assert_equals([i * 2 for i in range(8)], test())
+        self.assert_equals([[0, 1, 2], [3, 4, 5], [6, 7]], batches)
+
+    def test_max_batch_bytes(self):
+        batches = []
+
+        @batch_coroutine(max_batch_bytes=5, size_fn=lambda args: len(args[0]),
+                         max_concurrent_chunks=1, accepts_kwargs=False)
+        def upper(arg_lists):
+            batches.append([s for s, in arg_lists])
+            if 'boom' in batches[-1]:
+                raise ValueError()
+            coro_return([s.upper() for s, in arg_lists])
+            yield
+
+        @runloop_coroutine()
+        def test():
+            values = yield [future(upper(s)) for s in ['ab', 'cd', 'e', 'toolong', 'boom', 'x']]
+            results = []
+            for v in values:
+                try:
+                    results.append((yield v))
+                except ValueError:
+                    results.append(None)
+            coro_return(results)
+
+        self.assert_equals(['AB', 'CD', 'E', 'TOOLONG', None, None], test())
+        self.assert_equals([['ab', 'cd', 'e'], ['toolong'], ['boom', 'x']], batches)
+
+    def test_dedupe(self):
+        batches = []
+
+        @batch_coroutine(dedupe=True)
+        def increment_once(arg_lists):
+            batches.append(arg_lists)
+            coro_return([args[0] + kwargs.get('by', 1) for args, kwargs in arg_lists])
+            yield
+
+        @runloop_coroutine()
+        def test():
+            results = yield [increment_once(1), increment_once(2), increment_once(1),
+                             increment_once(1, by=2), increment_once(1, by=2)]
+            coro_return(results)
+
+        self.assert_equals([2, 3, 2, 3, 3], test())
+        self.assert_equals([[((1,), {}), ((2,), {}), ((1,), {'by': 2})]], batches)
+
+    def test_dedupe_key(self):
+        batches = []
+
+        @batch_coroutine(key=lambda s: s.lower(), accepts_kwargs=False)
+        def upper(arg_lists):
+            batches.append([s for s, in arg_lists])
+            coro_return([s.upper() for s, in arg_lists])
+            yield
+
+        @runloop_coroutine()
+        def test():
+            results = yield [upper('ab'), upper('AB'), upper('c')]
+            coro_return(results)
+
+        self.assert_equals(['AB', 'AB', 'C'], test())
+        self.assert_equals([['ab', 'c']], batches)
+
+    def test_dedupe_unhashable(self):
+        batches = []
+
+        @batch_coroutine(dedupe=True, accepts_kwargs=False)
+        def length(arg_lists):
+            batches.append([x for x, in arg_lists])
+            coro_return([len(x) for x, in arg_lists])
+            yield
+
+        @runloop_coroutine()
+        def test():
+            values = yield [length('ab'), length(['a']), length('ab'), length(['a'])]
+            coro_return(values)
+
+        # Unhashable arguments go out without deduplication.
+        self.assert_equals([2, 1, 2, 1], test())
+        self.assert_equals([['ab', ['a'], ['a']]], batches)
+
+    def test_cache_per_loop(self):
+        batches = []
+
+        @batch_coroutine(cache_per_loop=True, accepts_kwargs=False)
+        def double(arg_lists):
+            batches.append([n for n, in arg_lists])
+            coro_return([n * 2 for n, in arg_lists])
+            yield
+
+        @runloop_coroutine()
+        def test():
+            first = yield double(1), double(2), double(1)
+            second = yield double(1), double(3)
+            prime_loop_cache(double, 100, 4)
+            clear_loop_cache(double, 2)
+            third = yield double(2), double(4)
+            clear_loop_cache(double)
+            fourth = yield double(1)
+            coro_return([first, second, third, fourth])
+
+        self.assert_equals([[2, 4, 2], [2, 6], [4, 100], 2], test())
+        self.assert_equals([[1, 2], [3], [2], [1]], batches)
+
+        @runloop_coroutine()
+        def test_again():
+            value = yield double(1)
+            coro_return(value)
+
+        # Caches don't outlive their run loop.
+        self.assert_equals(2, test_again())
+        self.assert_equals([[1, 2], [3], [2], [1], [1]], batches)
+
+    def test_cache_per_loop_exception(self):
+        calls = []
+
+        @batch_coroutine(cache_per_loop=True)
+        def flaky(arg_lists):
+            calls.append(len(arg_lists))
+            if len(calls) == 1:
+                raise ValueError()
+            coro_return([ar[0] for ar, _ in arg_lists])
+            yield
+
+        @runloop_coroutine()
+        def test():
+            values = yield future(flaky(1)), future(flaky(1))
+            errors = 0
+            for v in values:
+                try:
+                    yield v
+                except ValueError:
+                    errors += 1
+            value = yield flaky(1)
+            coro_return((errors, value))
+
+        self.assert_equals((2, 1), test())
+        self.assert_equals([1, 1], calls)
+
+    def test_cache_per_loop_method(self):
+        class Client(object):
+            def __init__(self):
+                self.batches = []
+
+            @class_batch_coroutine(cache_per_loop=True, accepts_kwargs=False)
+            def get(self, arg_lists):
+                self.batches.append(arg_lists)
+                coro_return([ar[0] for ar in arg_lists])
+                yield
+
+        a, b = Client(), Client()
+
+        @runloop_coroutine()
+        def test():
+            prime_loop_cache(a.get, 'primed', 1)
+            values = yield a.get(1), b.get(1)
+            coro_return(values)
+
+        self.assert_equals(['primed', 1], test())
+        self.assert_equals([], a.batches)
+        self.assert_equals([[(1,)]], b.batches)
+
+    def test_abandoned_calls(self):
+        batches = []
+
+        @batch_coroutine(accepts_kwargs=False)
+        def record(arg_lists):
+            batches.append(sorted(n for n, in arg_lists))
+            coro_return([n for n, in arg_lists])
+            yield
+
+        @runloop_coroutine()
+        def fail():
+            raise ValueError()
+            yield  # pylint: disable-msg=W0101
+
+        @runloop_coroutine()
+        def failing_branch(n):
+            yield record(n), fail()
+
+        @runloop_coroutine()
+        def test():
+            kept = yield future(record(1))
+            try:
+                yield failing_branch(2), record(3)
+            except ValueError:
+                pass
+            value = yield kept
+            coro_return(value)
+
+        self.assert_equals(1, test())
+        self.assert_equals([[1]], batches)
+
+        del batches[:]
+        @runloop_coroutine()
+        def test_all_abandoned():
+            try:
+                yield failing_branch(1), record(2)
+            except ValueError:
+                pass
+            value = yield record(3)
+            coro_return(value)
+
+        self.assert_equals(3, test_all_abandoned())
+        self.assert_equals([[3]], batches)
+
+    def test_optional(self):
+        budgets = []
+
+        @batch_coroutine(optional=60)
+        def extras(arg_lists):
+            budgets.append(remaining_time())
+            coro_return([True] * len(arg_lists))
+            yield
+
+        @runloop_coroutine()
+        def get_extras():
+            try:
+                value = yield extras()
+            except Timeout:
+                value = False
+            coro_return(value)
+
+        self.assert_equals(False, runloop_coroutine(deadline=30)(get_extras)())
+        self.assert_equals([], budgets)
+
+        self.assert_equals(True, runloop_coroutine(deadline=120)(get_extras)())
+        self.assert_true(60 < budgets[0] <= 120)
+
+        self.assert_equals(True, get_extras())
+        self.assert_equals(None, budgets[1])
+
+    def test_timeout_between_batches(self):
+        @batch_coroutine(accepts_kwargs=False)
+        def slow_increment(arg_lists):
+            time.sleep(0.01)
+            coro_return([n + 1 for n, in arg_lists])
+            yield
+
+        @runloop_coroutine()
+        def count(n):
+            for _ in range(n):
+                yield slow_increment(0)  # One batch round after another.
+            coro_return(n)
+
+        @runloop_coroutine()
+        def test():
+            try:
+                yield (yield future(count(100), timeout=0.05))
+            except Timeout:
+                pass
+            try:
+                yield runloop_coroutine(deadline=0.05)(count)(100)
+            except Timeout:
+                coro_return('timeout')
+
+        start = time.time()
+        self.assert_equals('timeout', test())
+        self.assert_true(time.time() - start < 0.5)
+
+    def test_async_def(self):
+        if sys.version_info < (3, 5):
+            raise SkipTest()
+
+        ns = dict(globals(), async_calls=[])
+        exec("""
+@batch_coroutine()
+async def async_increment(arg_lists):
+    async_calls.append(arg_lists)
+    return [ar[0] + 1 for ar, _ in arg_lists]
+
+@runloop_coroutine()
+async def add_2(n):
+    return await increment(await async_increment(n))
+
+@runloop_coroutine()
+def test():
+    values = yield add_2(1), add_2(2), add_2(3)
+    coro_return(values)
+""", ns)
+
+        self.assert_equals([3, 4, 5], ns['test']())
+        self.assert_equals(1, len(ns['async_calls']))
+        self.assert_equals(1, CALL_COUNT)
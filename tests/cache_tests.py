@@ -0,0 +1,156 @@
+from batchy import runloop
+from batchy.runloop import coro_return, runloop_coroutine, future
+from batchy.batch_coroutine import batch_coroutine, class_batch_coroutine
+from batchy.cache import BatchCache
+
+from . import BaseTestCase
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class BatchCacheTests(BaseTestCase):
+    def test_lru(self):
+        cache = BatchCache(max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assert_equals(1, cache.get('a'))
+        cache.set('c', 3)
+
+        self.assert_equals(None, cache.get('b'))
+        self.assert_equals(1, cache.get('a'))
+        self.assert_equals(3, cache.get('c'))
+        self.assert_equals(1, cache.stats()['evictions'])
+
+    def test_lfu(self):
+        cache = BatchCache(max_entries=2, policy='lfu')
+        cache.set('a', 1)
+        cache.set('b', 2)
+        for _ in range(3):
+            cache.get('b')
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assert_equals(None, cache.get('a'))
+        self.assert_equals(2, cache.get('b'))
+        self.assert_equals(3, cache.get('c'))
+
+    def test_max_bytes(self):
+        cache = BatchCache(max_bytes=5, size_fn=len)
+        cache.set('a', 'xx')
+        cache.set('b', 'yyy')
+        cache.set('c', 'z')
+        cache.set('d', 'toolong')
+
+        self.assert_equals(None, cache.get('a'))
+        self.assert_equals('yyy', cache.get('b'))
+        self.assert_equals('z', cache.get('c'))
+        self.assert_equals(None, cache.get('d'))
+        self.assert_equals(4, cache.stats()['bytes'])
+
+    def test_ttl(self):
+        clock = FakeClock()
+        cache = BatchCache(ttl=10, negative_ttl=1, clock=clock)
+        cache.set('a', 1)
+        cache.set('missing', None)
+
+        clock.now += 2
+        self.assert_equals(1, cache.get('a'))
+        self.assert_equals('default', cache.get('missing', 'default'))
+
+        clock.now += 10
+        self.assert_equals(None, cache.get('a'))
+        self.assert_equals(0, len(cache))
+        self.assert_equals(2, cache.stats()['expirations'])
+
+    def test_default_clock(self):
+        # TTLs use the same (monotonic, where available) clock as deadlines.
+        self.assert_true(BatchCache(ttl=10).clock is runloop.clock)
+
+    def test_negative_caching(self):
+        cache = BatchCache()
+        cache.set('missing', None)
+        self.assert_equals(None, cache.get('missing', 'default'))
+
+        no_negative = BatchCache(negative_ttl=0)
+        no_negative.set('missing', None)
+        self.assert_equals('default', no_negative.get('missing', 'default'))
+
+    def test_stats(self):
+        cache = BatchCache()
+        cache.set('a', 1)
+        cache.set('b', None)
+        cache.get('a')
+        cache.get('b')
+        cache.get('c')
+
+        stats = cache.stats()
+        self.assert_equals((1, 1, 1), (stats['hits'], stats['negative_hits'], stats['misses']))
+
+    def test_batch_coroutine(self):
+        batches = []
+        cache = BatchCache(max_entries=100)
+
+        @batch_coroutine(cache=cache, accepts_kwargs=False)
+        def lookup(arg_lists):
+            batches.append([k for k, in arg_lists])
+            if 'boom' in batches[-1]:
+                raise ValueError()
+            coro_return([k.upper() if k != 'missing' else None for k, in arg_lists])
+            yield
+
+        @runloop_coroutine()
+        def test(keys):
+            values = yield [future(lookup(k)) for k in keys]
+            results = []
+            for v in values:
+                try:
+                    results.append((yield v))
+                except ValueError:
+                    results.append('error')
+            coro_return(results)
+
+        self.assert_equals(['A', 'B', None], test(['a', 'b', 'missing']))
+        self.assert_equals(['A', 'C', None], test(['a', 'c', 'missing']))
+        self.assert_equals(['A', 'error'], test(['a', 'boom']))
+        # Exceptions aren't cached.
+        self.assert_equals(['error'], test(['boom']))
+
+        self.assert_equals([['a', 'b', 'missing'], ['c'], ['boom'], ['boom']], batches)
+        stats = cache.stats()
+        self.assert_equals((2, 1), (stats['hits'], stats['negative_hits']))
+
+    def test_class_batch_coroutine(self):
+        cache = BatchCache(max_entries=100)
+        loop_cache = BatchCache(max_entries=100)
+
+        class Backend(object):
+            def __init__(self, name):
+                self.name = name
+
+            @class_batch_coroutine(cache=cache, accepts_kwargs=False)
+            def get(self, arg_lists):
+                coro_return(['%s:%s' % (self.name, k) for k, in arg_lists])
+                yield
+
+            @class_batch_coroutine(cache=loop_cache, cache_per_loop=True, accepts_kwargs=False)
+            def get_in_loop(self, arg_lists):
+                coro_return(['%s:%s' % (self.name, k) for k, in arg_lists])
+                yield
+
+        a, b = Backend('a'), Backend('b')
+
+        @runloop_coroutine()
+        def test(method):
+            first = yield method(a, 1)
+            second = yield method(b, 1)
+            coro_return((first, second))
+
+        for method in (Backend.get, Backend.get_in_loop):
+            self.assert_equals(('a:1', 'b:1'), test(method))
+            self.assert_equals(('a:1', 'b:1'), test(method))
+        self.assert_equals(2, cache.stats()['hits'])
+        self.assert_equals(2, loop_cache.stats()['hits'])
@@ -0,0 +1,163 @@
+import threading
+import time
+
+from batchy.runloop import coro_return, runloop_coroutine, Timeout
+from batchy.batch_coroutine import batch_coroutine, class_batch_coroutine
+from batchy.coalesce import Coalescer
+
+from . import BaseTestCase
+
+COALESCER = Coalescer(window=0.2)
+BATCHES = []
+
+@batch_coroutine(accepts_kwargs=False, coalesce=COALESCER)
+def increment(arg_lists):
+    BATCHES.append(sorted(n for n, in arg_lists))
+    coro_return([n + 1 for n, in arg_lists])
+    yield
+
+@batch_coroutine(accepts_kwargs=False, coalesce=COALESCER)
+def double(arg_lists):
+    BATCHES.append(sorted(n for n, in arg_lists))
+    coro_return([n * 2 for n, in arg_lists])
+    yield
+
+@batch_coroutine(accepts_kwargs=False, coalesce=COALESCER)
+def negate(arg_lists):
+    BATCHES.append(sorted(n for n, in arg_lists))
+    coro_return([-n for n, in arg_lists])
+    yield
+
+@batch_coroutine(accepts_kwargs=False, max_batch_size=10, coalesce=COALESCER)
+def chunked(arg_lists):
+    BATCHES.append(len(arg_lists))
+    coro_return([n for n, in arg_lists])
+    yield
+
+class Store(object):
+    def __init__(self, name):
+        self.name = name
+
+    @class_batch_coroutine(accepts_kwargs=False, coalesce=COALESCER)
+    def get(self, arg_lists):
+        BATCHES.append((self.name, len(arg_lists)))
+        coro_return([(self.name, n) for n, in arg_lists])
+        yield
+
+@batch_coroutine(accepts_kwargs=False, coalesce=COALESCER)
+def fail(arg_lists):
+    BATCHES.append(len(arg_lists))
+    raise ValueError()
+    yield  # pylint: disable-msg=W0101
+
+@runloop_coroutine()
+def add_one(n):
+    value = yield increment(n)
+    coro_return(value)
+
+@runloop_coroutine()
+def add_one_twice(n):
+    values = yield increment(n), increment(n + 100)
+    coro_return(values)
+
+@runloop_coroutine()
+def three_functions(n):
+    values = yield increment(n), double(n), negate(n)
+    coro_return(values)
+
+@runloop_coroutine()
+def call_chunked(count):
+    values = yield [chunked(n) for n in range(count)]
+    coro_return(values)
+
+@runloop_coroutine()
+def failed(n):
+    try:
+        yield fail(n)
+    except ValueError:
+        coro_return('failed')
+
+class CoalescerTests(BaseTestCase):
+    def setup(self):
+        del BATCHES[:]
+        COALESCER.max_items = None
+
+    def run_threads(self, fn, count):
+        """Calls fn(n) in its own run loop in `count` threads at once."""
+        go = threading.Event()
+        results = {}
+
+        def run(n):
+            go.wait()
+            results[n] = fn(n)
+
+        threads = [threading.Thread(target=run, args=(n,)) for n in range(count)]
+        for thread in threads:
+            thread.start()
+        go.set()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_single_thread(self):
+        self.assert_equals([2, 102], add_one_twice(1))
+        self.assert_equals([[1, 101]], BATCHES)
+
+    def test_one_window_per_round(self):
+        start = time.time()
+        self.assert_equals([2, 2, -1], three_functions(1))
+        self.assert_true(time.time() - start < COALESCER.window * 2)
+        self.assert_equals([[1], [1], [1]], BATCHES)
+
+    def test_threads(self):
+        results = self.run_threads(add_one_twice, 5)
+
+        self.assert_equals(dict((n, [n + 1, n + 101]) for n in range(5)), results)
+        self.assert_equals([sorted(list(range(5)) + list(range(100, 105)))], BATCHES)
+
+    def test_max_items(self):
+        COALESCER.max_items = 2
+        results = self.run_threads(add_one, 4)
+
+        self.assert_equals(dict((n, n + 1) for n in range(4)), results)
+        self.assert_equals([2, 2], sorted(len(batch) for batch in BATCHES))
+
+    def test_threads_several_functions(self):
+        results = self.run_threads(three_functions, 3)
+
+        self.assert_equals(dict((n, [n + 1, n * 2, -n]) for n in range(3)), results)
+        self.assert_equals([[0, 1, 2]] * 3, BATCHES)
+
+    def test_own_chunks(self):
+        self.assert_equals(list(range(25)), call_chunked(25))
+        self.assert_equals([10, 10, 5], BATCHES)
+
+    def test_threads_max_batch_size(self):
+        results = self.run_threads(lambda n: call_chunked(4), 3)
+
+        self.assert_equals(dict((n, list(range(4))) for n in range(3)), results)
+        self.assert_equals([4, 8], sorted(BATCHES))
+
+    def test_instances(self):
+        a, b = Store('a'), Store('b')
+
+        @runloop_coroutine()
+        def test():
+            values = yield a.get(1), b.get(2)
+            coro_return(values)
+
+        self.assert_equals([('a', 1), ('b', 2)], test())
+        self.assert_equals([('a', 1), ('b', 1)], sorted(BATCHES))
+
+    def test_deadline(self):
+        start = time.time()
+        self.assert_raises(Timeout, runloop_coroutine(deadline=0.05)(add_one), 1)
+        self.assert_true(time.time() - start < COALESCER.window)
+        self.assert_equals([], BATCHES)
+        self.assert_equals({}, COALESCER.groups)
+
+    def test_exception(self):
+        results = self.run_threads(failed, 3)
+
+        self.assert_equals(dict((n, 'failed') for n in range(3)), results)
+        self.assert_equals([3], BATCHES)
@@ -1,5 +1,8 @@
+import sys
+from unittest import SkipTest
+
 from batchy.context import runloop_coroutine_with_context, runloop_coroutine_begin_context, get_context
-from batchy.runloop import coro_return
+from batchy.runloop import coro_return, runloop_coroutine, future
 
 from . import BaseTestCase
 
@@ -58,3 +61,45 @@ class ContextTestCase(BaseTestCase):
             yield
 
         test()
+
+    def test_context_kept_after_clear(self):
+        @runloop_coroutine_begin_context()
+        def cleared():
+            get_context().a = 2
+            yield
+
+        @runloop_coroutine_begin_context()
+        def test():
+            get_context().a = 1
+            yield cleared()
+            self.assert_equals(1, get_context().a)
+            self.assert_equals(1, (yield return_context('a')))
+
+        test()
+
+    def test_context_through_plain_coroutines(self):
+        @runloop_coroutine()
+        def plain():
+            value = yield return_context('a')
+            coro_return(value)
+
+        @runloop_coroutine_begin_context()
+        def test():
+            get_context().a = 4
+            later = yield future(plain())
+            self.assert_equals([4, 4], (yield plain(), later))
+
+        test()
+
+    def test_context_await(self):
+        if sys.version_info < (3, 5):
+            raise SkipTest()
+
+        ns = dict(globals())
+        exec("""
+@runloop_coroutine_begin_context()
+async def test():
+    get_context().a = 5
+    return await return_context('a')
+""", ns)
+        self.assert_equals(5, ns['test']())
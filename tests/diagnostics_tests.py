@@ -0,0 +1,136 @@
+import os
+import sys
+import warnings
+import weakref
+
+from batchy import diagnostics
+from batchy.runloop import coro_return, runloop_coroutine
+from batchy.batch_coroutine import batch_coroutine
+
+from . import BaseTestCase
+
+@batch_coroutine(accepts_kwargs=False)
+def double(arg_lists):
+    coro_return([n * 2 for n, in arg_lists])
+    yield
+
+@runloop_coroutine()
+def one_at_a_time(n):
+    results = []
+    for i in range(n):
+        results.append((yield double(i)))
+    coro_return(results)
+
+@runloop_coroutine()
+def all_at_once(n):
+    results = yield [double(i) for i in range(n)]
+    coro_return(results)
+
+class DiagnosticsTests(BaseTestCase):
+    def setup(self):
+        self.findings = []
+        diagnostics.enable(threshold=3, report=self.findings.append)
+
+    def teardown(self):
+        diagnostics.disable()
+
+    def test_consecutive_batches(self):
+        self.assert_equals([0, 2, 4, 6], one_at_a_time(4))
+
+        self.assert_equals(1, len(self.findings))
+        finding = self.findings[0]
+        self.assert_equals('consecutive_batches', finding.kind)
+        self.assert_in('double', finding.message)
+        self.assert_equals(['one_at_a_time'], [name for _, _, name in finding.frames])
+        self.assert_equals(__file__.rstrip('c'), finding.frames[0][0].rstrip('c'))
+
+    def test_batched(self):
+        all_at_once(10)
+        all_at_once(10)
+        self.assert_equals([], self.findings)
+
+    def test_repeated_loops(self):
+        for i in range(5):
+            all_at_once(i)
+
+        self.assert_equals(['repeated_loops'], [f.kind for f in self.findings])
+        self.assert_equals('test_repeated_loops', self.findings[0].frames[0][2])
+
+    def test_separate_calls(self):
+        def handle_request(i):
+            return all_at_once(i)
+
+        for i in range(5):
+            handle_request(i)
+        self.assert_equals([], self.findings)
+
+    def test_separate_call_sites(self):
+        for i in range(5):
+            all_at_once(i)
+            all_at_once(i)
+        self.assert_equals([], self.findings)
+
+    def test_user_state_untouched(self):
+        def handle_request():
+            all_at_once(1)
+            return sorted(locals())
+
+        self.assert_equals([], handle_request())
+        namespace = {'all_at_once': all_at_once}
+        exec('all_at_once(1)', namespace)
+        self.assert_equals(['__builtins__', 'all_at_once'], sorted(namespace))
+
+    def test_user_state_untouched_by_repeated_loops(self):
+        def handle_request():
+            for i in range(3):
+                all_at_once(i)
+            return sorted(locals())
+
+        self.assert_equals(['i'], handle_request())
+        namespace = {'all_at_once': all_at_once}
+        exec('for i in range(3):\n    all_at_once(i)\n', namespace)
+        self.assert_equals(['__builtins__', 'all_at_once', 'i'], sorted(namespace))
+        self.assert_equals(['repeated_loops'] * 2, [f.kind for f in self.findings])
+
+    def test_no_profile_hook(self):
+        for i in range(5):
+            all_at_once(i)
+        self.assert_is_none(sys.getprofile())
+
+    def test_frame_not_kept(self):
+        class Request(object):
+            pass
+
+        def handle_request(request):
+            return all_at_once(1)
+
+        request = Request()
+        ref = weakref.ref(request)
+        handle_request(request)
+        del request
+        self.assert_is_none(ref())
+
+    def test_sibling_directory_is_not_batchy(self):
+        class Code(object):
+            co_filename = os.path.join(diagnostics._BATCHY_DIR + '_ext', 'module.py')
+
+        class Frame(object):
+            f_code = Code()
+
+        self.assert_false(diagnostics._is_batchy_frame(Frame()))
+        Code.co_filename = os.path.join(diagnostics._BATCHY_DIR, 'contrib', 'module.py')
+        self.assert_true(diagnostics._is_batchy_frame(Frame()))
+
+    def test_warning(self):
+        diagnostics.enable(threshold=2)
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            one_at_a_time(2)
+
+        self.assert_equals(1, len([w for w in caught
+                                   if w.category is diagnostics.RoundTripWarning]))
+
+    def test_disabled(self):
+        diagnostics.disable()
+        one_at_a_time(4)
+        self.assert_equals([], self.findings)
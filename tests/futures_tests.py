@@ -1,11 +1,17 @@
-from threading import Semaphore
+from functools import partial
+import os
+import sys
+import time
+from threading import Event, Semaphore
 from unittest.case import SkipTest
 
-from batchy.runloop import coro_return, runloop_coroutine
-from batchy.batch_coroutine import batch_coroutine, class_batch_coroutine
+from batchy.runloop import coro_return, runloop_coroutine, future, remaining_time, Timeout
+from batchy.context import runloop_coroutine_with_context
+from batchy.batch_coroutine import (batch_coroutine, class_batch_coroutine,
+                                    use_concurrent_dispatch, use_inline_dispatch)
 
 try:
-    from concurrent.futures import ThreadPoolExecutor
+    from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
     import batchy.futures as batchy_futures
 except ImportError:
@@ -14,6 +20,25 @@ except ImportError:
 
 from . import BaseTestCase
 
+class LazyProcessPool(object):
+    """Starts its pool on first use, so importing this module (as the pool's
+    workers do) doesn't."""
+    def __init__(self, workers):
+        self.workers = workers
+        self.pool = None
+
+    def submit(self, *args, **kwargs):
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(self.workers)
+        return self.pool.submit(*args, **kwargs)
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+PROCESS_POOL = LazyProcessPool(2)
+
 CALL_COUNT = 0
 
 @batch_coroutine()
@@ -26,7 +51,32 @@ def increment(arg_lists):
     coro_return([increment_single(*ar, **kw) for ar, kw in arg_lists])
     yield
 
+@batch_coroutine(accepts_kwargs=False, executor=PROCESS_POOL, split=2)
+def double_in_process(arg_lists):
+    return [(n * 2, len(arg_lists), os.getpid()) for n, in arg_lists]
+
+@batch_coroutine(accepts_kwargs=False, executor=PROCESS_POOL)
+def increment_in_process(arg_lists):
+    coro_return([n + 1 for n, in arg_lists])
+    yield
+
+@batch_coroutine(accepts_kwargs=False, executor=PROCESS_POOL)
+def budget_in_process(arg_lists):
+    return [remaining_time()] * len(arg_lists)
+
+class Multiplier(object):
+    def __init__(self, factor):
+        self.factor = factor
+
+    @class_batch_coroutine(accepts_kwargs=False, executor=PROCESS_POOL)
+    def multiply_in_process(self, arg_lists):
+        return [(n * self.factor, os.getpid()) for n, in arg_lists]
+
 class FuturesTests(BaseTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        PROCESS_POOL.shutdown()
+
     def setup(self):
         if not batchy_futures:
             raise SkipTest()
@@ -36,6 +86,9 @@ class FuturesTests(BaseTestCase):
         global CALL_COUNT
         CALL_COUNT = 0
 
+    def teardown(self):
+        self.pool.shutdown()
+
     def test_simple_futures(self):
         sema = Semaphore(0)
 
@@ -94,3 +147,227 @@ class FuturesTests(BaseTestCase):
             yield future2
 
         test()  # shouldn't hang
+
+    def test_concurrent_dispatch(self):
+        first_started, second_started = Event(), Event()
+
+        @batch_coroutine()
+        def first(arg_lists):
+            first_started.set()
+            coro_return([second_started.wait(5)] * len(arg_lists))
+            yield
+
+        @batch_coroutine()
+        def second(arg_lists):
+            second_started.set()
+            coro_return([first_started.wait(5)] * len(arg_lists))
+            yield
+
+        @runloop_coroutine()
+        def test():
+            values = yield first(), second(), increment(1), increment(2)
+            coro_return(values)
+
+        executor = ThreadPoolExecutor(3)
+        use_concurrent_dispatch(partial(batchy_futures.submit, executor))
+        try:
+            self.assert_equals([True, True, 2, 3], test())
+        finally:
+            use_inline_dispatch()
+            executor.shutdown()
+
+        self.assert_equals(1, CALL_COUNT)
+
+    def test_batches_while_waiting(self):
+        batch_started = Event()
+        executor = ThreadPoolExecutor(1)
+
+        @batch_coroutine()
+        def start(arg_lists):
+            batch_started.set()
+            coro_return([None] * len(arg_lists))
+            yield
+
+        @runloop_coroutine()
+        def fast_then_batch():
+            value = yield batchy_futures.submit(self.pool, lambda: 1)
+            yield start()
+            coro_return(value)
+
+        @runloop_coroutine()
+        def test():
+            # The batch has to go out while the loop is still waiting on
+            # the slow future.
+            values = yield (batchy_futures.submit(executor, batch_started.wait, 5),
+                            fast_then_batch())
+            coro_return(values)
+
+        try:
+            self.assert_equals([True, 1], test())
+        finally:
+            batch_started.set()
+            executor.shutdown()
+
+    def test_max_concurrent_chunks(self):
+        events = []
+        executor = ThreadPoolExecutor(4)
+
+        @batch_coroutine(accepts_kwargs=False, executor=executor, max_batch_size=1,
+                         max_concurrent_chunks=2)
+        def wait_for(arg_lists):
+            (event, name), = arg_lists
+            events.append('start ' + name)
+            event.wait(5)
+            events.append('end ' + name)
+            return [name]
+
+        slow, fast = Event(), Event()
+        fast.set()
+
+        @runloop_coroutine()
+        def test():
+            values = yield [wait_for(slow, 'slow'), wait_for(fast, 'fast 1'),
+                            wait_for(fast, 'fast 2'), wait_for(fast, 'fast 3')]
+            coro_return(values)
+
+        @runloop_coroutine()
+        def release_slow():
+            # Once every fast chunk went out, while the slow one still runs.
+            while len(events) < 7:
+                yield batchy_futures.submit(executor, time.sleep, 0.01)
+            slow.set()
+
+        @runloop_coroutine()
+        def both():
+            values, _ = yield test(), release_slow()
+            coro_return(values)
+
+        try:
+            self.assert_equals(['slow', 'fast 1', 'fast 2', 'fast 3'], both())
+        finally:
+            slow.set()
+            executor.shutdown()
+        self.assert_equals('end slow', events[-1])
+
+    def test_many_futures(self):
+        pool = ThreadPoolExecutor(4)
+
+        @runloop_coroutine()
+        def test():
+            values = yield [batchy_futures.submit(pool, lambda i=i: i) for i in range(100)]
+            coro_return(values)
+
+        try:
+            self.assert_equals(list(range(100)), test())
+        finally:
+            pool.shutdown()
+
+    def test_timeout(self):
+        release = Event()
+
+        @runloop_coroutine()
+        def test():
+            slow = yield future(batchy_futures.submit(self.pool, release.wait), timeout=0.01)
+            try:
+                yield slow
+            except Timeout:
+                coro_return('timeout')
+
+        # The loop doesn't wait for the abandoned call either.
+        try:
+            self.assert_equals('timeout', test())
+        finally:
+            release.set()
+
+    def test_deadline(self):
+        release = Event()
+
+        @runloop_coroutine(deadline=0.01)
+        def test():
+            yield batchy_futures.submit(self.pool, release.wait)
+
+        try:
+            self.assert_raises(Timeout, test)
+        finally:
+            release.set()
+
+    def test_deadline_in_executor(self):
+        @batch_coroutine()
+        def budget(arg_lists):
+            coro_return([remaining_time()] * len(arg_lists))
+            yield
+
+        use_concurrent_dispatch(partial(batchy_futures.submit, self.pool))
+        try:
+            value = runloop_coroutine(deadline=60)(budget)()
+        finally:
+            use_inline_dispatch()
+        self.assert_true(0 < value <= 60)
+
+    def test_context_coroutine_batch_function(self):
+        executor = ThreadPoolExecutor(1)
+
+        @runloop_coroutine_with_context()
+        def double(arg_lists):
+            coro_return([args[0] * 2 for args, _ in arg_lists])
+            yield
+
+        on_executor = batch_coroutine(executor=executor)(double)
+        dispatched = batch_coroutine()(double)
+
+        @runloop_coroutine()
+        def test(fn):
+            values = yield fn(1), fn(2)
+            coro_return(values)
+
+        try:
+            self.assert_equals([2, 4], test(on_executor))
+
+            use_concurrent_dispatch(partial(batchy_futures.submit, executor))
+            try:
+                self.assert_equals([2, 4], test(dispatched))
+            finally:
+                use_inline_dispatch()
+        finally:
+            executor.shutdown()
+
+    def test_process_executor(self):
+        @runloop_coroutine()
+        def test():
+            values = yield [double_in_process(i) for i in range(10)] + [increment_in_process(1)]
+            coro_return(values)
+
+        values = test()
+        self.assert_equals(2, values.pop())
+        self.assert_equals([(i * 2, 5) for i in range(10)], [v[:2] for v in values])
+        self.assert_not_in(os.getpid(), [v[2] for v in values])
+
+    def test_process_executor_budget(self):
+        self.assert_true(0 < runloop_coroutine(deadline=60)(budget_in_process)(1) <= 60)
+        self.assert_is_none(budget_in_process(1))
+
+    def test_process_executor_method(self):
+        if sys.version_info < (3, 3):
+            raise SkipTest()
+
+        @runloop_coroutine()
+        def test():
+            values = yield [Multiplier(3).multiply_in_process(i) for i in range(4)]
+            coro_return(values)
+
+        values = test()
+        self.assert_equals([0, 3, 6, 9], [v[0] for v in values])
+        self.assert_not_in(os.getpid(), [v[1] for v in values])
+
+    def test_process_executor_method_py2(self):
+        if sys.version_info >= (3, 3):
+            raise SkipTest()
+
+        def method(self, arg_lists):
+            pass
+
+        pool = ProcessPoolExecutor(1)
+        try:
+            self.assert_raises(TypeError, class_batch_coroutine(executor=pool), method)
+        finally:
+            pool.shutdown()
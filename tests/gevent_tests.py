@@ -1,17 +1,28 @@
 from unittest.case import SkipTest
 
-from batchy.runloop import coro_return, runloop_coroutine, use_gevent_local, use_threading_local
+from batchy.runloop import (coro_return, runloop_coroutine, use_gevent_local, use_threading_local,
+                            Timeout)
 from batchy.batch_coroutine import batch_coroutine, class_batch_coroutine
 
 try:
     import gevent
-    from gevent.coros import Semaphore
+    try:
+        from gevent.lock import Semaphore
+    except ImportError:
+        from gevent.coros import Semaphore
 
     import batchy.gevent as batchy_gevent
 except ImportError:
     batchy_gevent = None
     print('Gevent not installed; skipping gevent tests.')
 
+try:
+    from concurrent.futures import ThreadPoolExecutor
+
+    import batchy.futures as batchy_futures
+except ImportError:
+    batchy_futures = None
+
 from . import BaseTestCase
 
 CALL_COUNT = 0
@@ -40,8 +51,8 @@ class GeventTests(BaseTestCase):
         global CALL_COUNT
         CALL_COUNT = 0
 
-    def tear_down(self):
-        if not batch_gevent:
+    def teardown(self):
+        if not batchy_gevent:
             return
 
         gevent.get_hub().print_exception = self.old_print_exception
@@ -105,3 +116,38 @@ class GeventTests(BaseTestCase):
             yield future2
 
         test()  # shouldn't hang
+
+    def test_deadline(self):
+        greenlet = gevent.spawn(gevent.sleep, 5)
+
+        @runloop_coroutine(deadline=0.05)
+        def test():
+            yield batchy_gevent.greenlet_get(greenlet)
+
+        try:
+            self.assert_raises(Timeout, test)
+        finally:
+            greenlet.kill()
+            gevent.sleep(0)  # Runs its links, letting go of the loop.
+
+    def test_future_from_thread(self):
+        if not batchy_futures:
+            raise SkipTest()
+
+        executor = ThreadPoolExecutor(1)
+
+        def sleep_then_return():
+            gevent.sleep(0.01)
+            return 1
+
+        @runloop_coroutine()
+        def test():
+            # The gevent wait has to wake up for a future finishing in a thread.
+            a, b = yield (batchy_gevent.spawn(sleep_then_return),
+                          batchy_futures.future_result(executor.submit(lambda: 2)))
+            coro_return(a + b)
+
+        try:
+            self.assert_equals(3, test())
+        finally:
+            executor.shutdown()
@@ -0,0 +1,67 @@
+import gc
+import os
+import signal
+from unittest.case import SkipTest
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from batchy import introspect
+from batchy.runloop import coro_return, runloop_coroutine
+from batchy.batch_coroutine import batch_coroutine
+
+from . import BaseTestCase
+
+@batch_coroutine(accepts_kwargs=False)
+def double(arg_lists):
+    coro_return([n * 2 for n, in arg_lists])
+    yield
+
+@runloop_coroutine()
+def fetch(n):
+    value = yield double(n)
+    coro_return(value)
+
+@runloop_coroutine()
+def inspect():
+    coro_return(introspect.dump_state())
+    yield
+
+@runloop_coroutine()
+def page():
+    _, _, state = yield fetch(1), fetch(2), inspect()
+    coro_return(state)
+
+class IntrospectTests(BaseTestCase):
+    def setup(self):
+        # Loops that raised can linger in reference cycles until collected.
+        gc.collect()
+
+    def test_dump_state(self):
+        state = page()
+
+        self.assert_in('RunLoop: round 1, ', state)
+        self.assert_in('in thread MainThread', state)
+        self.assert_in('page (%s' % __file__.rstrip('c'), state)
+        self.assert_equals(2, state.count('> fetch ('))
+        self.assert_in('> inspect (', state)
+        self.assert_in('[queued in batch %s.double]' % __name__, state)
+        self.assert_in('%s.double: 2 call(s)' % __name__, state)
+        self.assert_in('Pending hooks:', state)
+
+    def test_idle(self):
+        self.assert_in('No run loops', introspect.dump_state())
+
+    def test_signal_handler(self):
+        if not hasattr(signal, 'SIGUSR1'):
+            raise SkipTest()
+
+        out = StringIO()
+        previous = introspect.install_signal_handler(signal.SIGUSR1, file=out)
+        try:
+            os.kill(os.getpid(), signal.SIGUSR1)
+        finally:
+            signal.signal(signal.SIGUSR1, previous)
+        self.assert_in('No run loops', out.getvalue())
@@ -3,8 +3,14 @@ from unittest.case import SkipTest
 
 from batchy.compat import PY3
 from batchy.clients.memcached import BatchMemcachedClient
+from batchy.coalesce import Coalescer
 from batchy.runloop import coro_return, runloop_coroutine
 
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    ThreadPoolExecutor = None
+
 from . import BaseTestCase
 
 try:
@@ -92,3 +98,23 @@ class MemcachedClientTests(BaseTestCase):
 
         self.client.prepend(self.key_prefix + b'hello', b'1')
         self.assert_equals(150, self.client.get(self.key_prefix + b'hello'))
+
+    def test_executor(self):
+        if ThreadPoolExecutor is None:
+            raise SkipTest()
+
+        executor = ThreadPoolExecutor(1)
+        self.client = BatchMemcachedClient(mc_client, executor=executor)
+
+        try:
+            self.test_multi_get()
+            self.test_multi_delete()
+            self.test_other_methods()
+        finally:
+            executor.shutdown()
+
+    def test_coalescer(self):
+        self.client = BatchMemcachedClient(mc_client, coalescer=Coalescer())
+
+        self.test_multi_get()
+        self.test_other_methods()
@@ -0,0 +1,95 @@
+import os
+import sys
+import tempfile
+from unittest.case import SkipTest
+
+from batchy.runloop import coro_return, runloop_coroutine, current_run_loop
+from batchy.batch_coroutine import batch_coroutine
+from batchy.context import runloop_coroutine_with_context
+from batchy.profiler import profiling
+
+from . import BaseTestCase
+
+@batch_coroutine(accepts_kwargs=False)
+def double(arg_lists):
+    coro_return([n * 2 for n, in arg_lists])
+    yield
+
+@runloop_coroutine_with_context()
+def busy(n):
+    total = sum(range(n))
+    value = yield double(total)
+    coro_return(value)
+
+@runloop_coroutine()
+def page():
+    a, b = yield busy(10), busy(20)
+    coro_return(a + b)
+
+class ProfilerTests(BaseTestCase):
+    def test_collapsed_stacks(self):
+        with profiling() as profiler:
+            self.assert_equals(2 * (45 + 190), page())
+
+        stacks = dict(line.rsplit(' ', 1) for line in profiler.collapsed('steps').splitlines())
+        self.assert_equals('2', stacks['page'])
+        self.assert_in('page;busy', stacks)
+        self.assert_true(any(stack.endswith(';double') for stack in stacks))
+        self.assert_true(profiler.collapsed('wall').strip())
+
+    def test_memory(self):
+        if sys.version_info < (3, 4):
+            raise SkipTest()
+
+        with profiling(memory=True) as profiler:
+            page()
+        self.assert_true(profiler.samples)
+
+    def test_write(self):
+        with profiling() as profiler:
+            page()
+
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            profiler.write(path, 'steps')
+            with open(path) as f:
+                self.assert_in('page;busy', f.read())
+        finally:
+            os.unlink(path)
+
+    def test_sibling_cancelled(self):
+        events = []
+
+        @runloop_coroutine()
+        def slow():
+            try:
+                yield page()
+                yield page()
+                events.append('resumed')
+            finally:
+                events.append('closed')
+
+        @runloop_coroutine()
+        def fail():
+            raise ValueError()
+            yield  # pylint: disable-msg=W0101
+
+        @runloop_coroutine()
+        def test():
+            try:
+                yield slow(), fail()
+            except ValueError:
+                coro_return(1)
+
+        with profiling():
+            self.assert_equals(1, test())
+        self.assert_equals(['closed'], events)
+
+    def test_not_profiling(self):
+        @runloop_coroutine()
+        def test():
+            yield page()
+            coro_return(current_run_loop().profiler)
+
+        self.assert_is_none(test())
@@ -11,6 +11,11 @@ except ImportError:
     batchy_gevent = None
     print('Gevent not installed; skipping redis gevent tests.')
 
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    ThreadPoolExecutor = None
+
 from . import BaseTestCase
 
 try:
@@ -59,3 +64,15 @@ class RedisClientTests(BaseTestCase):
         self.client = BatchRedisClient(redis_client, batchy_gevent.spawn)
 
         self.test_simple_get()
+
+    def test_executor_get(self):
+        if ThreadPoolExecutor is None:
+            raise SkipTest()
+
+        executor = ThreadPoolExecutor(1)
+        self.client = BatchRedisClient(redis_client, executor=executor)
+
+        try:
+            self.test_simple_get()
+        finally:
+            executor.shutdown()
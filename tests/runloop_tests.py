@@ -1,9 +1,12 @@
 import sys
+import time
 from unittest.case import SkipTest
 
+from batchy import runloop
 from batchy.compat import PY3
 from batchy.local import RunLoopLocal
-from batchy.runloop import coro_return, runloop_coroutine, deferred, future, current_run_loop, wait
+from batchy.runloop import coro_return, runloop_coroutine, deferred, future, current_run_loop, wait, awaitable, \
+    run_in_new_loop, remaining_time, Timeout
 
 from . import BaseTestCase
 
@@ -43,6 +46,19 @@ def block_loop(n):
     with current_run_loop().on_queue_exhausted.connected_to(unblock):
         yield d
 
+@runloop_coroutine()
+def spin(rounds):
+    for _ in range(rounds):
+        yield block_loop(1)
+
+@runloop_coroutine()
+def record_close(events, rounds=1):
+    try:
+        yield spin(rounds)
+        events.append('resumed')
+    finally:
+        events.append('closed')
+
 class RunLoopTests(BaseTestCase):
     def test_simple_runnable(self):
         self.assert_equal(1, increment(0))
@@ -62,6 +78,69 @@ def increment_py3(arg):
         self.assert_equal(1, increment_py3(0))
         self.assert_equal(2, increment_py3(1))
 
+    def test_async_def(self):
+        if sys.version_info < (3, 5):
+            raise SkipTest()
+
+        ns = dict(globals())
+        exec("""
+@runloop_coroutine()
+async def add_3(arg):
+    arg = await awaitable(add_2(arg))
+    a, b = await awaitable([increment(arg), return_none()])
+    assert b is None
+    d = await awaitable(deferred())
+    d.set_value(a)
+    return await d
+""", ns)
+
+        self.assert_equal(3, ns['add_3'](0))
+
+    def test_async_def_dependency(self):
+        if sys.version_info < (3, 5):
+            raise SkipTest()
+
+        ns = dict(globals())
+        exec("""
+@runloop_coroutine()
+async def async_increment(arg):
+    return arg + 1
+
+@runloop_coroutine()
+async def async_raise():
+    raise ValueError()
+
+@runloop_coroutine()
+def test():
+    a = yield async_increment(1)
+    b = yield future(async_increment(a))
+    try:
+        yield async_raise()
+    except ValueError:
+        v = yield b
+        coro_return(v)
+""", ns)
+
+        self.assert_equal(3, ns['test']())
+
+    def test_async_def_exception(self):
+        if sys.version_info < (3, 5):
+            raise SkipTest()
+
+        ns = dict(globals())
+        exec("""
+@runloop_coroutine()
+async def test():
+    try:
+        await awaitable([raise_value_error(), block_loop(1)])
+    except ValueError:
+        return await awaitable(wait([(await awaitable(future(increment(1))))]))
+""", ns)
+
+        ready = ns['test']()
+        self.assert_equal(1, len(ready))
+        self.assert_equal(2, ready[0].get())
+
     def test_dependencies(self):
         self.assert_equal(2, add_2(0))
         self.assert_equal(3, add_2(1))
@@ -124,6 +203,35 @@ def increment_py3(arg):
         self.assert_equals((1, None), test())
         self.assert_equals((1, None), test())
 
+    def test_local_initialize(self):
+        initialized = []
+
+        class Counter(RunLoopLocal):
+            def initialize(self):
+                initialized.append(True)
+                self.count = 0
+
+            def increment(self):
+                self.count += 1
+                return self.count
+
+        counter = Counter()
+
+        @runloop_coroutine()
+        def inner():
+            coro_return(counter.increment())
+            yield
+
+        @runloop_coroutine()
+        def test():
+            counter.increment()
+            counter.increment()
+            coro_return((counter.count, run_in_new_loop(inner), counter.count))
+            yield
+
+        self.assert_equals((2, 1, 2), test())
+        self.assert_equals(2, len(initialized))
+
     def test_exception(self):
         @runloop_coroutine()
         def test(a):
@@ -294,6 +402,215 @@ def increment_py3(arg):
 
         self.assert_raises(ValueError, test)
 
+    def test_sibling_cancelled(self):
+        events = []
+
+        @runloop_coroutine()
+        def test():
+            try:
+                yield record_close(events), raise_value_error()
+            except ValueError:
+                coro_return(1)
+
+        self.assert_equals(1, test())
+        self.assert_equals(['closed'], events)
+
+    def test_dropped_future_runs(self):
+        events = []
+
+        @runloop_coroutine()
+        def test():
+            yield future(record_close(events))  # Fire and forget.
+            dropped = yield future(record_close(events))
+            del dropped
+            coro_return(1)
+
+        self.assert_equals(1, test())
+        self.assert_equals(['resumed', 'closed'] * 2, events)
+
+    def test_future_timeout(self):
+        events = []
+
+        @runloop_coroutine()
+        def test():
+            slow = yield future(record_close(events, 5), timeout=0)
+            try:
+                yield slow
+            except Timeout:
+                coro_return('timeout')
+
+        self.assert_equals('timeout', test())
+        self.assert_equals(['closed'], events)
+
+    def test_deadline(self):
+        @runloop_coroutine(deadline=0.01)
+        def test():
+            yield spin(10 ** 6)
+
+        self.assert_raises(Timeout, test)
+
+    def test_nested_deadline(self):
+        slow = runloop_coroutine(deadline=0)(lambda: spin(5))
+
+        @runloop_coroutine()
+        def test():
+            try:
+                yield slow()
+            except Timeout:
+                coro_return('timeout')
+
+        self.assert_equals('timeout', test())
+
+    def test_remaining_time(self):
+        @runloop_coroutine(deadline=60)
+        def with_deadline():
+            coro_return(remaining_time())
+            yield
+
+        @runloop_coroutine()
+        def without_deadline():
+            coro_return(remaining_time())
+            yield
+
+        self.assert_true(0 < with_deadline() <= 60)
+        self.assert_equals(None, without_deadline())
+        self.assert_equals(None, remaining_time())
+
+    def test_deadline_clock(self):
+        if not hasattr(time, 'monotonic'):
+            raise SkipTest()
+        # Changes to the wall clock don't move deadlines.
+        self.assert_true(runloop.clock is time.monotonic)
+
+    def test_recycled_runnables_cleared(self):
+        @runloop_coroutine()
+        def test():
+            try:
+                yield add_2(1), raise_value_error()
+            except ValueError:
+                pass
+            coro_return(current_run_loop().free_runnables)
+
+        free = test()
+        self.assert_true(free)
+        for runnable in free:
+            self.assert_equals((None,) * 8, (
+                runnable.iterable, runnable.parent, runnable.callback, runnable.callback_exc,
+                runnable.result, runnable.result_exception, runnable.exception_to_raise,
+                runnable.dependency_results))
+
+    def test_recycled_runnable_reuse(self):
+        @runloop_coroutine()
+        def test():
+            results = []
+            for _ in range(3):
+                try:
+                    yield raise_value_error()
+                except ValueError:
+                    results.append('raised')
+                results.append((yield add_2(1)))
+                results.append((yield return_none()))
+            coro_return(results)
+
+        self.assert_equals(['raised', 3, None] * 3, test())
+
+    def test_recycled_after_sibling_raised(self):
+        @runloop_coroutine()
+        def failing_pair():
+            yield raise_value_error(), spin(3)
+
+        @runloop_coroutine()
+        def test():
+            try:
+                yield failing_pair()
+            except ValueError:
+                pass
+            # The abandoned spin() finishes while these reuse runnables.
+            values = yield [spin(i) for i in range(5)] + [add_2(i) for i in range(5)]
+            coro_return(values[5:])
+
+        self.assert_equals([2, 3, 4, 5, 6], test())
+
+    def test_deferred_after_runnable_released(self):
+        @runloop_coroutine()
+        def get(d):
+            value = yield d
+            coro_return(value)
+
+        @runloop_coroutine()
+        def slow_value():
+            yield spin(2)
+            coro_return('value')
+
+        @runloop_coroutine()
+        def test():
+            d = yield future(slow_value())
+            first = yield get(d)
+            yield add_2(1), add_2(2)  # Reuses the runnable that ran get().
+            second, third = yield get(d), d
+            coro_return([first, second, third])
+
+        self.assert_equals(['value'] * 3, test())
+
+    def test_resolved_deferred_inline(self):
+        added = []
+        def on_added(_, runnable):
+            added.append(runnable)
+
+        @runloop_coroutine()
+        def test():
+            d = yield deferred()
+            d.set_value(2)
+            with current_run_loop().on_runnable_added.connected_to(on_added):
+                v = yield d
+                v = yield increment(v)
+            coro_return(v)
+
+        self.assert_equal(3, test())
+        self.assert_equal(1, len(added))  # Only increment() needed a runnable.
+
+    def test_synchronous_chain(self):
+        total_iterations = [0]
+        def inc_total_iterations(_):
+            total_iterations[0] += 1
+
+        @runloop_coroutine()
+        def chain(n):
+            if n == 0:
+                coro_return(0)
+            v = yield chain(n - 1)
+            coro_return(v + 1)
+
+        @runloop_coroutine()
+        def test():
+            with current_run_loop().on_iteration.connected_to(inc_total_iterations):
+                v = yield chain(5000)
+            coro_return(v)
+
+        self.assert_equal(5000, test())
+        self.assert_equal(0, total_iterations[0])
+
+    def test_bare_yield_polls(self):
+        @runloop_coroutine()
+        def poll(d):
+            while not d.ready:
+                yield
+            v = yield d
+            coro_return(v)
+
+        @runloop_coroutine()
+        def set_later(d):
+            yield
+            d.set_value(1)
+
+        @runloop_coroutine()
+        def test():
+            d = yield deferred()
+            values = yield poll(d), set_later(d)
+            coro_return(values)
+
+        self.assert_equal([1, None], test())
+
     def test_ready_wait(self):
         @runloop_coroutine()
         def test():
@@ -0,0 +1,182 @@
+import threading
+from unittest.case import SkipTest
+
+from batchy import stats
+from batchy.runloop import coro_return, runloop_coroutine, Timeout
+from batchy.batch_coroutine import batch_coroutine
+from batchy.context import runloop_coroutine_begin_context
+from batchy.server import SharedRunLoop
+from batchy.util import memoized_coroutine
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+
+    import batchy.futures as batchy_futures
+except ImportError:
+    batchy_futures = None
+
+from . import BaseTestCase
+
+BATCHES = []
+DB = {}
+READS = []
+
+@batch_coroutine(accepts_kwargs=False)
+def increment(arg_lists):
+    BATCHES.append(len(arg_lists))
+    coro_return([n + 1 for n, in arg_lists])
+    yield
+
+@batch_coroutine(accepts_kwargs=False, cache_per_loop=True)
+def cached_increment(arg_lists):
+    BATCHES.append(len(arg_lists))
+    coro_return([n + 1 for n, in arg_lists])
+    yield
+
+@runloop_coroutine()
+def add_2(n):
+    n = yield increment(n)
+    n = yield increment(n)
+    coro_return(n)
+
+@memoized_coroutine()
+def read(key):
+    READS.append(key)
+    coro_return(DB[key])
+    yield
+
+@runloop_coroutine()
+def read_twice(key):
+    first = yield read(key)
+    second = yield read_in_new_context(key)
+    coro_return((first, second))
+
+@runloop_coroutine_begin_context()
+def read_in_new_context(key):
+    value = yield read(key)
+    coro_return(value)
+
+@runloop_coroutine()
+def wait_for(future):
+    yield batchy_futures.future_result(future)
+
+@runloop_coroutine()
+def raise_value_error():
+    raise ValueError()
+    yield  # pylint: disable-msg=W0101
+
+class SharedRunLoopTests(BaseTestCase):
+    def setup(self):
+        del BATCHES[:]
+        del READS[:]
+        self.shared = SharedRunLoop(linger=0.2)
+        self.shared.start()
+
+    def teardown(self):
+        self.shared.stop()
+        self.assert_false(self.shared.thread.is_alive())
+
+    def test_call(self):
+        self.assert_equals(3, self.shared.call(add_2, 1))
+        self.assert_equals(4, self.shared.call(add_2, 2))
+        self.assert_equals([1, 1, 1, 1], BATCHES)
+
+    def test_exception(self):
+        self.assert_raises(ValueError, self.shared.call, raise_value_error)
+        self.assert_equals(2, self.shared.call(increment, 1))
+
+    def test_batches_across_threads(self):
+        go = threading.Event()
+        results = {}
+
+        def request(n):
+            go.wait()
+            results[n] = self.shared.call(add_2, n)
+
+        threads = [threading.Thread(target=request, args=(n,)) for n in range(10)]
+        for thread in threads:
+            thread.start()
+        go.set()
+        for thread in threads:
+            thread.join()
+
+        self.assert_equals(dict((n, n + 2) for n in range(10)), results)
+        self.assert_equals([10, 10], BATCHES)
+
+    def test_max_items(self):
+        self.shared.max_items = 1
+        self.shared.linger = 60
+        self.assert_equals(3, self.shared.call(add_2, 1))
+
+    def test_loop_cache_cleared_when_idle(self):
+        self.assert_equals(2, self.shared.call(cached_increment, 1))
+        self.assert_equals(2, self.shared.call(cached_increment, 1))
+        self.assert_equals([1, 1], BATCHES)
+
+    def test_submit(self):
+        calls = [self.shared.submit(increment, n) for n in range(3)]
+        self.assert_equals([1, 2, 3], [call.result() for call in calls])
+
+    def test_result_timeout(self):
+        # Still lingering for other calls to join its batch.
+        call = self.shared.submit(increment, 1)
+        self.assert_raises(Timeout, call.result, 0.01)
+        self.assert_equals(2, call.result())
+
+    def test_submit_after_stop(self):
+        self.shared.stop()
+        self.assert_raises(RuntimeError, self.shared.submit, increment, 1)
+        self.assert_raises(RuntimeError, self.shared.call, increment, 1)
+
+    def test_memoized_per_call(self):
+        DB['x'] = 1
+        self.assert_equals((1, 1), self.shared.call(read_twice, 'x'))
+        DB['x'] = 2
+        self.assert_equals((2, 2), self.shared.call(read_twice, 'x'))
+        # Memoized within a call, including in contexts it begins.
+        self.assert_equals(['x', 'x'], READS)
+
+    def test_caches_per_call_under_load(self):
+        if not batchy_futures:
+            raise SkipTest()
+
+        # A call that stays in flight the whole time.
+        executor = ThreadPoolExecutor(1)
+        release = threading.Event()
+        blocked = self.shared.submit(wait_for, executor.submit(release.wait))
+        try:
+            DB['x'] = 1
+            self.assert_equals((1, 1), self.shared.call(read_twice, 'x'))
+            self.assert_equals(2, self.shared.call(cached_increment, 1))
+            DB['x'] = 2
+            self.assert_equals((2, 2), self.shared.call(read_twice, 'x'))
+            self.assert_equals(2, self.shared.call(cached_increment, 1))
+            self.assert_equals([1, 1], BATCHES)
+        finally:
+            release.set()
+            blocked.result()
+            executor.shutdown()
+
+    def test_loop_failure(self):
+        def start(calls):
+            raise ValueError()
+        self.shared._start = start
+
+        self.assert_raises(ValueError, self.shared.call, increment, 1)
+        self.shared.thread.join(5)
+        self.assert_raises(RuntimeError, self.shared.call, increment, 1)
+
+    def test_stats(self):
+        stats.snapshot(reset=True)
+        stats.enable()
+        shared = SharedRunLoop(linger=0)
+        shared.start()
+        try:
+            shared.call(add_2, 1)
+            snapshot = stats.snapshot(reset=True)
+            self.assert_equals(2, snapshot['batches.%s.increment.items' % __name__])
+            self.assert_equals(0, snapshot['loops'])
+        finally:
+            stats.disable()
+            shared.stop()
+        self.assert_equals(1, stats.snapshot(reset=True)['loops'])
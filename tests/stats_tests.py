@@ -0,0 +1,88 @@
+import time
+from unittest.case import SkipTest
+
+from batchy import stats
+from batchy.runloop import coro_return, runloop_coroutine, current_run_loop, Timeout
+from batchy.batch_coroutine import batch_coroutine
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+
+    import batchy.futures as batchy_futures
+except ImportError:
+    batchy_futures = None
+
+from . import BaseTestCase
+
+@batch_coroutine(accepts_kwargs=False)
+def double(arg_lists):
+    coro_return([n * 2 for n, in arg_lists])
+    yield
+
+class StatsTests(BaseTestCase):
+    def setup(self):
+        stats.snapshot(reset=True)
+        stats.enable()
+
+    def teardown(self):
+        stats.disable()
+        stats.snapshot(reset=True)
+
+    def test_disabled(self):
+        stats.disable()
+
+        @runloop_coroutine()
+        def test():
+            yield double(1)
+            coro_return(current_run_loop().stats)
+
+        self.assert_is_none(test())
+        self.assert_equals(0, stats.snapshot()['loops'])
+
+    def test_batches(self):
+        @runloop_coroutine()
+        def test():
+            yield double(1), double(2)
+            yield double(3)
+            coro_return(current_run_loop().rounds)
+
+        rounds = test()
+        test()
+
+        snapshot = stats.snapshot(reset=True)
+        name = 'batches.%s.double' % __name__
+        self.assert_equals(2, snapshot['loops'])
+        self.assert_equals(2 * rounds, snapshot['rounds'])
+        self.assert_equals(4, snapshot[name + '.dispatches'])
+        self.assert_equals(6, snapshot[name + '.items'])
+        self.assert_true(snapshot['steps'] > 0)
+
+        self.assert_equals(0, stats.snapshot()['loops'])
+
+    def test_deadline(self):
+        @runloop_coroutine(deadline=0.01)
+        def test():
+            while True:
+                time.sleep(0.005)
+                yield double(1)
+
+        self.assert_raises(Timeout, test)
+        self.assert_equals(1, stats.snapshot()['loops'])
+
+    def test_futures_wait(self):
+        if not batchy_futures:
+            raise SkipTest()
+
+        pool = ThreadPoolExecutor(1)
+
+        @runloop_coroutine()
+        def test():
+            value = yield batchy_futures.submit(pool, lambda: time.sleep(0.05) or 1)
+            coro_return(value)
+
+        self.assert_equals(1, test())
+        pool.shutdown()
+
+        snapshot = stats.snapshot()
+        self.assert_equals(1, snapshot['waits'])
+        self.assert_true(snapshot['wait_seconds'] >= 0)
@@ -0,0 +1,90 @@
+import json
+import os
+import tempfile
+import time
+
+from batchy.runloop import coro_return, runloop_coroutine, current_run_loop, Timeout
+from batchy.batch_coroutine import batch_coroutine
+from batchy.trace import tracing
+
+from . import BaseTestCase
+
+@batch_coroutine(accepts_kwargs=False)
+def double(arg_lists):
+    coro_return([n * 2 for n, in arg_lists])
+    yield
+
+@runloop_coroutine()
+def fast():
+    coro_return(1)
+    yield
+
+@runloop_coroutine()
+def slow(n):
+    a = yield double(n)
+    b = yield double(a)
+    coro_return(b)
+
+@runloop_coroutine()
+def page():
+    a, b = yield fast(), slow(1)
+    coro_return(a + b)
+
+class TraceTests(BaseTestCase):
+    def test_trace(self):
+        with tracing() as tracer:
+            self.assert_equals(5, page())
+
+        events = tracer.to_json()['traceEvents']
+        by_cat = {}
+        for e in events:
+            by_cat.setdefault(e['cat'], []).append(e)
+
+        self.assert_equals(2, len(by_cat['batch']))
+        self.assert_equals([1, 1], [e['args']['size'] for e in by_cat['batch']])
+        self.assert_true(len(by_cat['round']) >= 2)
+
+        begins = dict((e['name'], e) for e in by_cat['coroutine'] if e['ph'] == 'b')
+        self.assert_true(begins['page']['args'].get('critical'))
+        self.assert_true(begins['slow']['args'].get('critical'))
+        self.assert_false(begins['fast']['args'].get('critical'))
+
+        path = [name for name, _, _ in tracer.critical_path()[0]]
+        self.assert_equals(['page', 'slow', 'double', 'deferred'], path)
+
+    def test_write(self):
+        with tracing() as tracer:
+            page()
+
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            tracer.write(path)
+            with open(path) as f:
+                self.assert_true(json.load(f)['traceEvents'])
+        finally:
+            os.unlink(path)
+
+    def test_deadline(self):
+        @runloop_coroutine(deadline=0.01)
+        def test():
+            while True:
+                time.sleep(0.005)
+                yield double(1)
+
+        with tracing() as tracer:
+            self.assert_raises(Timeout, test)
+
+        self.assert_equals(['test'], [span.name for span in tracer.roots])
+        rounds = [e for e in tracer.to_json()['traceEvents'] if e['cat'] == 'round']
+        self.assert_true(rounds)
+
+    def test_not_tracing(self):
+        @runloop_coroutine()
+        def test():
+            yield fast()
+            coro_return(current_run_loop().tracer)
+
+        with tracing():
+            pass
+        self.assert_is_none(test())